@@ -0,0 +1,74 @@
+"""Benchmark of the content-sniffing classifier.
+
+Creates a flat folder of small files (a share of them without an extension or
+with a misleading one) and measures extension-only classification, header
+sniffing read one by one and header sniffing batched over a thread pool.
+
+Usage (from Clean_folder_program): python -m benchmarks.bench_classify --files 100000 [--dir /dev/shm]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from clean_folder.classify import Classifier
+from clean_folder.clean import extensions
+
+
+HEADERS = {
+    'jpg': b'\xff\xd8\xff\xe0' + b'\0' * 60,
+    'png': b'\x89PNG\r\n\x1a\n' + b'\0' * 56,
+    'pdf': b'%PDF-1.7\n' + b'\0' * 55,
+    'zip': b'PK\x03\x04' + b'\0' * 60,
+    'mp3': b'ID3\x04' + b'\0' * 60,
+    'txt': b'plain text file\n' * 4,
+}
+
+
+def make_files(folder, count, unnamed_share):
+    random.seed(0)
+    kinds = list(HEADERS)
+    for i in range(count):
+        kind = random.choice(kinds)
+        name = f'file_{i}' if random.random() < unnamed_share else f'file_{i}.{kind}'
+        with open(os.path.join(folder, name), 'wb') as file:
+            file.write(HEADERS[kind])
+    return [entry.path for entry in os.scandir(folder)]
+
+
+def measure(label, func, files):
+    start = time.perf_counter()
+    result = func(files)
+    elapsed = time.perf_counter() - start
+    recognized = sum(1 for kind in result if kind is not None)
+    print(f'{label:<32} {elapsed:8.3f} s  {len(files) / elapsed:12,.0f} files/s  recognized: {recognized}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100_000)
+    parser.add_argument('--unnamed', type=float, default=0.3,
+                        help='Share of files created without an extension.')
+    parser.add_argument('--dir', default=None, help='Where to create the test folder.')
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as folder:
+        files = make_files(folder, args.files, args.unnamed)
+
+        def extension_only(paths):
+            kinds = (p.split('.')[-1].lower() for p in paths)
+            return [kind if kind in extensions else None for kind in kinds]
+
+        fast = Classifier(extensions, workers=1)
+        measure('extension fast path + sniff', fast.classify_many, files)
+        measure('  same, cached', fast.classify_many, files)
+        measure('extension + sniff, batched', Classifier(extensions, workers=args.workers).classify_many, files)
+        measure('sniff every file, sequential', Classifier(extensions, verify=True, workers=1).classify_many, files)
+        measure('sniff every file, batched', Classifier(extensions, verify=True, workers=args.workers).classify_many, files)
+        measure('extension split only (old)', extension_only, files)
+
+
+if __name__ == '__main__':
+    main()
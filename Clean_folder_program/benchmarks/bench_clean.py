@@ -0,0 +1,191 @@
+"""Benchmark suite for the whole clean_folder pipeline on synthetic trees.
+
+Generates a reproducible tree (depth, fan-out, file count, extension mix,
+Polish and Cyrillic names, nested zip/tar/gz archives), runs `main` on it on
+tmpfs and/or on disk, and appends the per-stage metrics of every run to a
+JSON-lines results file, so changes to the scanner, mover or unpacker can be
+compared over time. Each repeat runs on a fresh copy of the tree; the
+"rerun" scenario measures a second, incremental run over the unchanged tree.
+
+Usage (from Clean_folder_program):
+    python -m benchmarks.bench_clean --files 20000 --depth 3 --fanout 5 --media tmpfs disk
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+import zipfile
+
+from clean_folder.clean import main
+from clean_folder.metrics import Profiler
+
+
+DEFAULT_MIX = 'jpg:20,png:10,txt:15,pdf:10,docx:5,mp3:8,mp4:5,xlsx:4,md:8,bin:5,log:5,none:5'
+ASCII_WORDS = ['report', 'photo', 'invoice', 'backup', 'notes', 'IMG', 'scan', 'draft']
+POLISH_WORDS = ['zdjęcie', 'faktura', 'Łódź', 'żółw', 'wakacje', 'ściana', 'część']
+CYRILLIC_WORDS = ['документ', 'Привіт', 'фото', 'звіт', 'Їжак', 'рахунок']
+MEDIA = {'tmpfs': '/dev/shm', 'disk': None}
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), 'results', 'clean_folder.jsonl')
+
+
+def parse_mix(mix):
+    extensions, weights = [], []
+    for item in mix.split(','):
+        extension, weight = item.split(':')
+        extensions.append('' if extension == 'none' else extension)
+        weights.append(float(weight))
+    return extensions, weights
+
+
+def random_name(rng, national_share):
+    roll = rng.random()
+    if roll < national_share / 2:
+        words = POLISH_WORDS
+    elif roll < national_share:
+        words = CYRILLIC_WORDS
+    else:
+        words = ASCII_WORDS
+    return f"{rng.choice(words)} {rng.choice(words)}"
+
+
+def make_archive(path, kind, rng, nesting):
+    members = {f"{random_name(rng, 0.5)}_{i}.txt": os.urandom(64) for i in range(3)}
+    if nesting > 0:
+        inner = path + '.inner'
+        make_archive(inner, rng.choice(['zip', 'tar', 'gz']), rng, nesting - 1)
+        with open(inner, 'rb') as file:
+            members[f"inner.{kind}"] = file.read()
+        os.remove(inner)
+
+    if kind == 'zip':
+        with zipfile.ZipFile(path, 'w') as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+    else:
+        with tarfile.open(path, 'w:gz' if kind == 'gz' else 'w') as archive:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+
+# Building folders breadth-first up to `depth` levels with `fanout` subfolders each,
+# then spreading the files over all folders. Archives go to the root, since only
+# the top-level "archives" folder is unpacked.
+def generate_tree(root, files, depth, fanout, mix, national_share, archives, nesting, file_size, seed):
+    rng = random.Random(seed)
+    folders = [root]
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for folder in level:
+            for i in range(fanout):
+                subfolder = os.path.join(folder, f"{random_name(rng, national_share)} {i}")
+                os.mkdir(subfolder)
+                next_level.append(subfolder)
+        folders.extend(next_level)
+        level = next_level
+
+    extensions, weights = parse_mix(mix)
+    payload = b'x' * file_size
+    for i in range(files):
+        extension = rng.choices(extensions, weights)[0]
+        name = f"{random_name(rng, national_share)} {i}" + (f".{extension}" if extension else '')
+        with open(os.path.join(rng.choice(folders), name), 'wb') as file:
+            file.write(payload)
+
+    for i in range(archives):
+        kind = rng.choice(['zip', 'tar', 'gz'])
+        suffix = '.tar.gz' if kind == 'gz' else f'.{kind}'
+        make_archive(os.path.join(root, f"archive {i}{suffix}"), kind, rng, nesting)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Running `main` quietly (no per-file logging or summary output) under a profiler
+def run_pipeline(path, full):
+    profiler = Profiler(count_calls=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        main(path, full=full, profiler=profiler)
+        elapsed = time.perf_counter() - start
+    return elapsed, profiler
+
+
+def print_run(label, elapsed, profiler):
+    stages = ', '.join(f"{stage.name} {stage.seconds:.3f}" for stage in profiler.stages)
+    print(f"  {label:<10} {elapsed:8.3f} s  ({stages})")
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=10_000)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='Extension weights, e.g. "jpg:20,txt:10,none:5".')
+    parser.add_argument('--national', type=float, default=0.3,
+                        help='Share of Polish and Cyrillic names.')
+    parser.add_argument('--archives', type=int, default=20)
+    parser.add_argument('--nesting', type=int, default=1, help='Archives nested inside archives.')
+    parser.add_argument('--file-size', type=int, default=1024)
+    parser.add_argument('--media', nargs='+', choices=list(MEDIA), default=['tmpfs', 'disk'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', default=RESULTS_FILE, help='JSON-lines file the runs are appended to.')
+    args = parser.parse_args()
+
+    logging.getLogger('clean_folder').setLevel(logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    params = {key: value for key, value in vars(args).items() if key not in ('media', 'results')}
+    revision = git_revision()
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+
+    for medium in args.media:
+        base = MEDIA[medium]
+        if base is not None and not os.path.isdir(base):
+            print(f"Skipping {medium}: {base} does not exist")
+            continue
+
+        with tempfile.TemporaryDirectory(dir=base) as workdir:
+            template = os.path.join(workdir, 'template')
+            os.mkdir(template)
+            start = time.perf_counter()
+            generate_tree(template, args.files, args.depth, args.fanout, args.mix, args.national,
+                          args.archives, args.nesting, args.file_size, args.seed)
+            print(f"{medium}: generated tree in {time.perf_counter() - start:.2f} s")
+
+            for repeat in range(args.repeat):
+                tree = os.path.join(workdir, f'run{repeat}')
+                shutil.copytree(template, tree)
+                for scenario, full in (('first', True), ('rerun', False)):
+                    elapsed, profiler = run_pipeline(tree, full)
+                    print_run(f"{scenario} #{repeat + 1}", elapsed, profiler)
+                    unpacked = sum(stage.files for stage in profiler.stages if stage.name == 'unpack')
+                    if scenario == 'first' and unpacked != args.archives:
+                        raise SystemExit(f"Expected {args.archives} archives to be unpacked, got {unpacked}")
+                    with open(args.results, 'a', encoding='utf-8') as file:
+                        file.write(json.dumps(dict(
+                            profiler.as_dict(), revision=revision, medium=medium, scenario=scenario,
+                            repeat=repeat, seconds=round(elapsed, 6), params=params)) + '\n')
+                shutil.rmtree(tree)
+
+    print(f"Results appended to {args.results}")
+
+
+if __name__ == '__main__':
+    main_benchmark()
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .classify import Classifier
+from .clean import (extensions, normalized_file_name, normalize_and_rename_folders,
+                    remove_empty_folders, summarize, unpack_archive)
+from .journal import Journal
+from .manifest import Manifest, INTERNAL_PREFIX
+from .metrics import Profiler
+from .mover import MoveEngine
+from .rules import RuleSet
+
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = ('zip', 'gz', 'tar')
+
+
+# Variant of the pipeline for high-latency storage (NFS, SMB): scanning,
+# classifying, moving and unpacking run as asyncio stages connected by bounded
+# queues, and every blocking filesystem call is sent to a thread pool, so up to
+# `concurrency` calls are in flight at once instead of one.
+class AsyncCleaner:
+    def __init__(self, path, concurrency=64, queue_size=1000, verify=False, rules_file=None,
+                 full=False, report_files=()):
+        self.path = os.path.normpath(path)
+        self.archives_folder = os.path.join(self.path, 'archives')
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.full = full
+        self.report_files = list(report_files)
+        self.rules = RuleSet.load(rules_file, extensions) if rules_file else RuleSet.from_extensions(extensions)
+        self.classifier = Classifier(self.rules.known_extensions, verify=verify, workers=1)
+        self.mover = MoveEngine(workers=concurrency)
+        self.executor = None
+        self.manifest = None
+        self.seen = []
+        self.source_folders = set()
+        self.files = []
+        self.category_of = {}
+        # Per-file errors logged by the workers, reported in the pipeline stage metrics
+        self.errors = 0
+
+    async def offload(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # Listing one folder in a worker thread: (subfolders, [(file path, stat)])
+    def list_folder(self, folder):
+        subfolders, files = [], []
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as e:
+            logger.warning(f'Cannot scan {folder}: {e}')
+            return subfolders, files
+        # Folders that were empty already are removed at the end, like the emptied ones
+        if not entries and folder != self.path:
+            self.source_folders.add(folder)
+        for entry in entries:
+            if entry.name.startswith(INTERNAL_PREFIX):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if folder != self.archives_folder:
+                    subfolders.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                files.append((entry.path, entry.stat(follow_symlinks=False)))
+        return subfolders, files
+
+    async def scan(self, folder, queue):
+        subfolders, files = await self.offload(self.list_folder, folder)
+        for file_path, stat in files:
+            self.seen.append(file_path)
+            if self.manifest.is_changed(file_path, stat):
+                self.source_folders.add(folder)
+                await queue.put(file_path)
+        await asyncio.gather(*(self.scan(subfolder, queue) for subfolder in subfolders))
+
+    # Rules with size or age predicates stat the file, so matching runs in the worker thread too
+    def classify_file(self, file_path):
+        extension = self.classifier.classify(file_path)
+        decision = self.rules.match(file_path, extension,
+                                    name_extension=self.classifier.extension_of(file_path))
+        return file_path, extension, decision
+
+    async def classify_worker(self, inbox, outbox):
+        while True:
+            file_path = await inbox.get()
+            try:
+                await outbox.put(await self.offload(self.classify_file, file_path))
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Wystąpił błąd przy {file_path}: {e}")
+            finally:
+                inbox.task_done()
+
+    # Moving a file to its destination under its normalized name in one rename,
+    # instead of a move followed by a separate rename
+    def move_file(self, file_path, decision):
+        folder, file = os.path.split(file_path)
+        target_folder = folder
+        if decision is not None:
+            parts = decision[1].split(os.sep)
+            if folder.split(os.sep)[-len(parts):] != parts:
+                target_folder = os.path.join(folder, *parts)
+                os.makedirs(target_folder, exist_ok=True)
+
+        # Archives keep their names until they are unpacked
+        if target_folder != self.archives_folder:
+            file = normalized_file_name(file)
+        dst = os.path.join(target_folder, file)
+        if dst != file_path:
+            self.mover.move(file_path, dst, decision[0] if decision else None)
+        return dst
+
+    async def move_worker(self, inbox, outbox):
+        while True:
+            file_path, extension, decision = await inbox.get()
+            try:
+                dst = await self.offload(self.move_file, file_path, decision)
+                if os.path.dirname(dst) == self.archives_folder and extension in ARCHIVE_EXTENSIONS:
+                    await outbox.put((dst, extension))
+                else:
+                    self.files.append(dst)
+                    self.category_of[dst] = decision[0] if decision else None
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Wystąpił błąd przy {file_path}: {e}")
+            finally:
+                inbox.task_done()
+
+    async def unpack_worker(self, inbox):
+        while True:
+            archive_path, extension = await inbox.get()
+            try:
+                await self.offload(unpack_archive, archive_path, extension,
+                                   self.archives_folder, self.classifier)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Wystąpił błąd przy {archive_path}: {e}")
+            finally:
+                inbox.task_done()
+
+    async def run(self, profiler=None):
+        profiler = profiler or Profiler()
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            self.manifest = Manifest(self.path) if self.full else await self.offload(Manifest.load, self.path)
+            to_classify = asyncio.Queue(self.queue_size)
+            to_move = asyncio.Queue(self.queue_size)
+            to_unpack = asyncio.Queue(self.queue_size)
+
+            # Extraction is CPU and write heavy, so it gets fewer workers
+            workers = [asyncio.create_task(self.classify_worker(to_classify, to_move))
+                       for _ in range(self.concurrency)]
+            workers += [asyncio.create_task(self.move_worker(to_move, to_unpack))
+                        for _ in range(self.concurrency)]
+            workers += [asyncio.create_task(self.unpack_worker(to_unpack))
+                        for _ in range(max(1, self.concurrency // 8))]
+
+            with profiler.stage('pipeline') as stage:
+                await self.scan(self.path, to_classify)
+                for queue in (to_classify, to_move, to_unpack):
+                    await queue.join()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                self.manifest.prune(self.seen)
+                stage.files = len(self.files)
+                stage.errors += self.errors
+                stage.bytes_moved = sum(stats['bytes'] for stats in self.mover.as_dict().values())
+
+            with profiler.stage('normalize_folders'):
+                renamed = await self.offload(normalize_and_rename_folders, self.path, self.files)
+                self.category_of = {new: self.category_of.get(old)
+                                    for old, new in zip(self.files, renamed)}
+                self.files = renamed
+            with profiler.stage('remove_empty') as stage:
+                stage.files = await self.offload(remove_empty_folders, self.path, self.source_folders)
+            with profiler.stage('report') as stage:
+                await self.offload(summarize, self.files, self.category_of, self.manifest,
+                                   self.rules, self.mover, self.report_files)
+                stage.files = len(self.files)
+        finally:
+            self.executor.shutdown()
+        return self.files
+
+
+def main_async(path, concurrency=64, verify=False, rules_file=None, full=False, report_files=(),
+               profiler=None):
+    try:
+        # The asyncio pipeline keeps no journal, so it must not run over an interrupted run
+        previous = Journal.load(os.path.normpath(path))
+        if previous is not None and not previous.committed:
+            print("Poprzednie uruchomienie zostało przerwane. Użyj --resume albo --rollback.")
+            return
+        cleaner = AsyncCleaner(path, concurrency=concurrency, verify=verify,
+                               rules_file=rules_file, full=full, report_files=report_files)
+        asyncio.run(cleaner.run(profiler))
+    except Exception as e:
+        logger.error(f"Wystąpił błąd: {str(e)}")
@@ -0,0 +1,125 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Number of bytes read from the start of a file; the tar magic sits at offset 257
+HEADER_SIZE = 512
+
+# (offset, magic bytes, extension) - the extension is a key of the `extensions` dict
+SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'jpg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'png'),
+    (0, b'GIF87a', 'gif'),
+    (0, b'GIF89a', 'gif'),
+    (0, b'%PDF-', 'pdf'),
+    (0, b'PK\x03\x04', 'zip'),
+    (0, b'PK\x05\x06', 'zip'),
+    (0, b'\x1f\x8b', 'gz'),
+    (257, b'ustar', 'tar'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'doc'),
+    (0, b'ID3', 'mp3'),
+    (0, b'\xff\xfb', 'mp3'),
+    (0, b'\xff\xf3', 'mp3'),
+    (0, b'OggS', 'ogg'),
+    (0, b'#!AMR', 'amr'),
+    (0, b'\x1aE\xdf\xa3', 'mkv'),
+]
+
+# Formats sharing a container: a matching signature confirms any of these extensions
+COMPATIBLE = {
+    'zip': {'zip', 'docx', 'xlsx', 'pptx'},
+    'mp4': {'mp4', 'mov'},
+    'gz': {'gz', 'tgz'},
+}
+
+
+def sniff(header):
+    # RIFF and ISO media files carry their type after a common prefix
+    if header[:4] == b'RIFF':
+        if header[8:12] == b'WAVE':
+            return 'wav'
+        if header[8:12] == b'AVI ':
+            return 'avi'
+    if header[4:8] == b'ftyp':
+        return 'mov' if header[8:10] == b'qt' else 'mp4'
+    for offset, magic, extension in SIGNATURES:
+        if header.startswith(magic, offset):
+            return extension
+    stripped = header.lstrip()
+    if stripped.startswith(b'<svg') or (stripped.startswith(b'<?xml') and b'<svg' in header):
+        return 'svg'
+    return None
+
+
+def read_header(file_path):
+    # A single unbuffered read is cheaper than opening a Python file object
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        return os.read(fd, HEADER_SIZE)
+    finally:
+        os.close(fd)
+
+
+# Classifying files by extension, falling back to the file header (magic numbers)
+# for files without a known extension. With verify=True the header is checked
+# even for known extensions, so files with a wrong extension are caught too.
+class Classifier:
+    def __init__(self, extensions, verify=False, workers=8, cache_size=100_000):
+        self.extensions = extensions
+        self.verify = verify
+        self.workers = workers
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def extension_of(self, file_path):
+        name = os.path.basename(file_path)
+        if '.' not in name.lstrip('.'):
+            return ''
+        return name.split('.')[-1].lower()
+
+    # Returns the extension (one of `extensions`) describing the file, or None when unrecognized
+    def classify(self, file_path):
+        extension = self.extension_of(file_path)
+        if extension in self.extensions and not self.verify:
+            return extension
+
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return extension if extension in self.extensions else None
+
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        if key in self.cache:
+            sniffed = self.cache[key]
+        else:
+            try:
+                sniffed = sniff(read_header(file_path)) if stat.st_size else None
+            except OSError:
+                sniffed = None
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[key] = sniffed
+
+        if sniffed is None:
+            return extension if extension in self.extensions else None
+        if extension in COMPATIBLE.get(sniffed, ()) and extension in self.extensions:
+            return extension
+        return sniffed if sniffed in self.extensions else None
+
+    # Header reads are spread over a thread pool, since they mostly wait on I/O
+    def classify_many(self, files):
+        files = list(files)
+        needs_header = [file_path for file_path in files
+                        if self.verify or self.extension_of(file_path) not in self.extensions]
+        if len(needs_header) < 2 or self.workers <= 1:
+            return [self.classify(file_path) for file_path in files]
+
+        # Each thread gets a chunk of files, so task overhead is paid per chunk
+        chunk_size = max(64, len(needs_header) // (self.workers * 4))
+        chunks = [needs_header[i:i + chunk_size]
+                  for i in range(0, len(needs_header), chunk_size)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(lambda chunk: [self.classify(p) for p in chunk], chunks)
+            sniffed = dict(zip(needs_header, (kind for chunk in results for kind in chunk)))
+        return [sniffed[file_path] if file_path in sniffed else self.classify(file_path)
+                for file_path in files]
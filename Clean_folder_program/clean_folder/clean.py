@@ -4,8 +4,20 @@ from pathlib import Path
 import zipfile
 import tarfile
 import sys
+import argparse
 from concurrent.futures import ThreadPoolExecutor
 import logging
+import re
+import unicodedata
+from functools import lru_cache
+
+from .classify import Classifier
+from .journal import Journal, NULL_JOURNAL
+from .manifest import Manifest, INTERNAL_PREFIX
+from .metrics import Profiler
+from .mover import MoveEngine
+from .report import SummaryReport
+from .rules import RuleSet
 
 
 extensions = {
@@ -39,23 +51,67 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Transliteration table built once at import time and applied with str.translate.
+# Polish letters, Cyrillic (Russian and Ukrainian) and other Latin letters with
+# diacritics (through Unicode decomposition) are mapped to ASCII.
+POLISH_SYMBOLS = 'ąćęłńóśźż'
+POLISH_TRANSLATION = 'acelnoszz'
+
+CYRILLIC_SYMBOLS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяєіїґ'
+CYRILLIC_TRANSLATION = (
+    'a', 'b', 'v', 'g', 'd', 'e', 'e', 'j', 'z', 'i', 'j', 'k', 'l', 'm', 'n',
+    'o', 'p', 'r', 's', 't', 'u', 'f', 'h', 'ts', 'ch', 'sh', 'sch', '', 'y',
+    '', 'e', 'yu', 'ya', 'je', 'i', 'ji', 'g',
+)
+
+# Letters that do not decompose into a base letter and a combining mark
+SPECIAL_LATIN = {'ß': 'ss', 'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE', 'ø': 'o', 'Ø': 'O',
+                 'đ': 'd', 'Đ': 'D', 'ð': 'd', 'Ð': 'D', 'þ': 'th', 'Þ': 'Th', 'ı': 'i'}
+
+
+def build_transliteration_table():
+    table = {}
+
+    # Latin-1 Supplement, Latin Extended-A/B and Latin Extended Additional
+    for code in list(range(0xC0, 0x250)) + list(range(0x1E00, 0x1F00)):
+        char = chr(code)
+        base = ''.join(c for c in unicodedata.normalize('NFKD', char)
+                       if not unicodedata.combining(c))
+        if base != char and base.isascii() and base.isalnum():
+            table[code] = base
+    for char, translation in SPECIAL_LATIN.items():
+        table[ord(char)] = translation
+
+    pairs = list(zip(POLISH_SYMBOLS, POLISH_TRANSLATION)) + list(zip(CYRILLIC_SYMBOLS, CYRILLIC_TRANSLATION))
+    for char, translation in pairs:
+        table[ord(char)] = translation
+        table[ord(char.upper())] = translation.capitalize()
+    return table
+
+
+TRANSLITERATION_TABLE = build_transliteration_table()
+NOT_ALLOWED = re.compile(r'[^\w.]')
+
+# Byte table for the common all-ASCII case: letters, digits and '.' stay, the rest becomes '_'
+ASCII_TABLE = bytes(code if chr(code).isalnum() or chr(code) == '.' else ord('_')
+                    for code in range(128)) + b'_' * 128
+
+
+# Names repeat a lot in real trees (IMG_0001, "Nowy folder", ...), so results are memoized
+@lru_cache(maxsize=65536)
 def transliterate_and_normalize(input_string):
-    # Creating a mapping for transliteration of Polish characters to ASCII characters
-    transliteration_map = {
-        'ą': 'a', 'ć': 'c', 'ę': 'e', 'ł': 'l',
-        'ń': 'n', 'ó': 'o', 'ś': 's', 'ź': 'z',
-        'ż': 'z',
-    }
-
-# Perform transliteration character by character and replace other characters with '_'
-    normalized_string = ''
-    for char in input_string:
-        normalized_char = transliteration_map.get(char, char)
-        if not normalized_char.isalnum() and normalized_char != '.':
-            normalized_char = '_'
-        normalized_string += normalized_char
-
-    return normalized_string
+    # Transliterate to ASCII first
+    if not input_string.isascii():
+        # Names from macOS are decomposed (NFD): "ż" arrives as "z" plus a combining dot
+        input_string = unicodedata.normalize('NFC', input_string).translate(TRANSLITERATION_TABLE)
+
+        # Letters without a transliteration (e.g. CJK) are kept, like isalnum() did before
+        if not input_string.isascii():
+            return NOT_ALLOWED.sub('_', input_string)
+
+    # Replace other characters with '_'
+    return input_string.encode('ascii').translate(ASCII_TABLE).decode('ascii')
+
 
 # Ask whether the directory should be organized.
 
@@ -70,228 +126,469 @@ def confirm_directory_cleanup(path):
         return False
 
 
-# Extracting extensions, creating folders, moving files
-def organize_files_by_extension_worker(args):
-    folder, extensions, verbose = args
-    archives_folder = os.path.join(folder, 'archives')
-
-    for folder, subfolders, files in os.walk(folder):
-        if os.path.normpath(folder) == os.path.normpath(archives_folder):
-            subfolders[:] = []
+# Collecting files to process in a single pass over the tree.
+# Subfolders of the "archives" folder hold unpacked content and are not scanned.
+# With a manifest, entries unchanged since the previous run are skipped.
+# Empty folders met on the way are added to empty_folders, when given.
+def collect_files(path, manifest=None, empty_folders=None):
+    root = os.path.normpath(path)
+    archives_folder = os.path.join(root, 'archives')
+    pending = []
+    seen = []
+    stack = [root]
+
+    while stack:
+        folder = stack.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as e:
+            logger.warning(f'Cannot scan {folder}: {e}')
             continue
-        for file in files:
-            extension = file.split('.')[-1].lower()
-            if extension in extensions:
-                folder_name = extensions[extension]
-                if not os.path.exists(os.path.join(folder, folder_name)):
-                    os.mkdir(os.path.join(folder, folder_name))
-                src = os.path.join(folder, file)
-                dst = os.path.join(folder, folder_name, file)
-                if verbose:
-                    logger.info(f'Moving {src} to {dst}')
-                shutil.move(src, dst)
+        if not entries and folder != root and empty_folders is not None:
+            empty_folders.append(folder)
+        for entry in entries:
+            # Skipping the manifest, journal and trash kept by the program itself
+            if entry.name.startswith(INTERNAL_PREFIX):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if folder != archives_folder:
+                    stack.append(entry.path)
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            seen.append(entry.path)
+            if manifest is None or manifest.is_changed(entry.path, entry.stat(follow_symlinks=False)):
+                pending.append(entry.path)
+
+    if manifest is not None:
+        manifest.prune(seen)
+    return pending
+
+
+# Classifying files (extension first, file header when needed) and deciding
+# with the rules where each of them goes: (category, destination) or None
+def classify_files(files, classifier, rules):
+    kinds = classifier.classify_many(files)
+    return [rules.match(file_path, extension, name_extension=classifier.extension_of(file_path))
+            for file_path, extension in zip(files, kinds)]
+
+
+# Creating folders and moving a file to the destination picked by the rules
+def organize_file(file_path, decision, verbose=False, mover=None, journal=NULL_JOURNAL):
+    if decision is None:
+        return file_path
+    category, destination = decision
+    folder, file = os.path.split(file_path)
+
+    # Files already sitting in their destination folder stay where they are
+    parts = destination.split(os.sep)
+    if folder.split(os.sep)[-len(parts):] == parts:
+        return file_path
+
+    # Creating missing folders one level at a time, so a rollback can remove each of them
+    target_folder = folder
+    for part in parts:
+        target_folder = os.path.join(target_folder, part)
+        if not os.path.isdir(target_folder):
+            with journal.operation('mkdir', path=target_folder):
+                os.makedirs(target_folder, exist_ok=True)
+    dst = os.path.join(target_folder, file)
+    if verbose:
+        logger.info(f'Moving {file_path} to {dst}')
+    with journal.operation('move', src=file_path, dst=dst):
+        if mover is not None:
+            mover.move(file_path, dst, category)
+        else:
+            shutil.move(file_path, dst)
+    return dst
 
 
 # Running multiple threads for organizing files
-def organize_files_by_extension_parallel(path, extensions, verbose=False):
-    with ThreadPoolExecutor() as executor:
-        args_list = [(path, extensions, verbose) for _ in os.walk(path)]
-        executor.map(organize_files_by_extension_worker, args_list)
+def organize_files_by_extension_parallel(files, decisions, verbose=False, mover=None, journal=NULL_JOURNAL):
+    mover = mover or MoveEngine()
+    with ThreadPoolExecutor(max_workers=mover.workers) as executor:
+        return list(executor.map(
+            lambda file_path, decision: organize_file(file_path, decision, verbose, mover, journal),
+            files, decisions))
+
+
+# Unpacking a single archive from the "archives" folder into a folder named after it
+def unpack_archive(archive_path, extension, archives_folder, classifier, journal=NULL_JOURNAL):
+    file = os.path.basename(archive_path)
+
+    # Archives recognized by their header get the matching extension,
+    # so the unpack folder does not collide with the archive itself
+    if classifier.extension_of(archive_path) != extension:
+        with journal.operation('rename', src=archive_path, dst=f"{archive_path}.{extension}"):
+            os.rename(archive_path, f"{archive_path}.{extension}")
+        archive_path, file = f"{archive_path}.{extension}", f"{file}.{extension}"
+
+    # Remove the file extension (both parts of ".tar.gz") from the archive name
+    folder_name = os.path.splitext(file)[0]
+    if folder_name.lower().endswith('.tar'):
+        folder_name = folder_name[:-4]
+    destination_path = os.path.join(archives_folder, folder_name)
+
+    # If the destination directory already exists, add a unique suffix
+    count = 1
+    while os.path.exists(destination_path):
+        destination_path = os.path.join(
+            archives_folder, f"{folder_name}_{count}")
+        count += 1
+
+    with journal.operation('unpack', archive=archive_path, dest=destination_path) as op_id:
+        # Unpack the archive
+        if extension == 'zip':
+            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+                zip_ref.extractall(destination_path)
+        elif extension == 'gz':
+            with tarfile.open(archive_path, 'r:gz') as tar_ref:
+                tar_ref.extractall(destination_path)
+        elif extension == 'tar':
+            with tarfile.open(archive_path, 'r') as tar_ref:
+                tar_ref.extractall(destination_path)
+
+        # Remove the original archive (the journal keeps it in its trash until the next run)
+        if os.path.exists(archive_path):
+            journal.discard(archive_path, op_id)
+    return destination_path
 
 
 # Moving and unpacking compressed files
-def unpack_archives(archives_folder, path):
-    # Search the "archives" directory for archive files
-    for folder, subfolders, files in os.walk(archives_folder):
-        for file in files:
-            extension = file.split('.')[-1].lower()
-            if extension in ('zip', 'gz', 'tar'):
-                archive_path = os.path.join(folder, file)
-
-                # Remove the file extension from the archive name
-                folder_name = os.path.splitext(file)[0]
-                if not os.path.exists(os.path.join(path, folder_name)):
-                    os.mkdir(os.path.join(path, folder_name))
-                destination_path = os.path.join(archives_folder, folder_name)
-
-                # If the destination directory already exists, add a unique suffix
-                count = 1
-                while os.path.exists(destination_path):
-                    destination_path = os.path.join(
-                        archives_folder, f"{folder_name}_{count}")
-                    count += 1
-
-                # Unpack the archive
-                if extension == 'zip':
-                    with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                        zip_ref.extractall(destination_path)
-                elif extension == 'gz':
-                    with tarfile.open(archive_path, 'r:gz') as tar_ref:
-                        tar_ref.extractall(destination_path)
-                elif extension == 'tar':
-                    with tarfile.open(archive_path, 'r') as tar_ref:
-                        tar_ref.extractall(destination_path)
-
-                # Remove the original archive
-                if os.path.exists(archive_path):
-                    os.remove(archive_path)
-
-
-# Function to convert Polish characters to standard ones and normalize file and folder names
-def normalize_and_rename_files(path):
-    archives_folder = os.path.join(path, 'archives')
-
-    for folder, subfolders, files in os.walk(path):
-
-        # Check if the current folder is the "archives" folder
-
-        if os.path.normpath(folder) == os.path.normpath(archives_folder):
-
-            # If so, skip this folder and its subfolders
-
-            subfolders[:] = []
+def unpack_archives(archives_folder, files, classifier=None, journal=NULL_JOURNAL):
+    classifier = classifier or Classifier(extensions)
+    remaining = []
+    for archive_path in files:
+        folder = os.path.dirname(archive_path)
+        if os.path.normpath(folder) != os.path.normpath(archives_folder):
+            remaining.append(archive_path)
             continue
-        for file in files:
-            old_file_path = Path(folder, file)
-
-            # Extracting the file extension
-            file_extension = old_file_path.suffix
-
-            # Removing the file extension from the file name
-            file_name_without_extension = old_file_path.stem
-
-            # Perform transliteration of Polish characters to ASCII and replace other characters with '_'
-            normalized_name = transliterate_and_normalize(
-                file_name_without_extension)
-
-            # Adding the file extension back
-            new_file_name = f"{normalized_name}{file_extension}"
-            new_file_path = Path(folder, new_file_name)
-
-            old_file_path.rename(new_file_path)
+        extension = classifier.classify(archive_path)
+        if extension not in ('zip', 'gz', 'tar'):
+            remaining.append(archive_path)
+            continue
+        unpack_archive(archive_path, extension, archives_folder, classifier, journal)
+    return remaining
 
 
-def normalize_and_rename_folders(path):
-    archives_folder = os.path.join(path, 'archives')
-    for folder, subfolders, _ in os.walk(path, topdown=False):
+# Transliterating the name of a file, keeping its extension
+def normalized_file_name(file_name):
+    file_path = Path(file_name)
+    return f"{transliterate_and_normalize(file_path.stem)}{file_path.suffix}"
 
-        # Check if the current folder is the "archives" folder
 
-        if os.path.normpath(folder) == os.path.normpath(archives_folder):
+# Function to convert Polish characters to standard ones and normalize file names
+def normalize_and_rename_files(path, files, journal=NULL_JOURNAL):
+    archives_folder = os.path.normpath(os.path.join(path, 'archives'))
+    renamed = []
 
-            # If so, skip this folder and its subfolders
+    for file_path in files:
+        old_file_path = Path(file_path)
 
-            subfolders[:] = []
+        # Archives keep their names until they are unpacked
+        if os.path.normpath(old_file_path.parent) == archives_folder:
+            renamed.append(file_path)
             continue
-        for subfolder in subfolders:
-            old_folder_path = Path(folder, subfolder)
-
-            # Transliterate Polish characters to ASCII and replace other characters with '_'
-            normalized_name = transliterate_and_normalize(subfolder)
 
-            # Adding the file extension back
-            new_folder_path = Path(folder, normalized_name)
+        # Perform transliteration of Polish characters to ASCII and replace other characters with '_'
+        new_file_path = old_file_path.with_name(normalized_file_name(old_file_path.name))
+
+        if new_file_path != old_file_path:
+            with journal.operation('rename', src=str(old_file_path), dst=str(new_file_path)):
+                old_file_path.rename(new_file_path)
+        renamed.append(str(new_file_path))
+    return renamed
+
+
+# Normalizing the folders that contain the given files, deepest first
+def normalize_and_rename_folders(path, files, journal=NULL_JOURNAL):
+    root = os.path.normpath(path)
+    folders = set()
+    for file_path in files:
+        folder = os.path.dirname(file_path)
+        while folder != root and folder not in folders:
+            folders.add(folder)
+            folder = os.path.dirname(folder)
+
+    renames = {}
+    for folder in sorted(folders, key=lambda f: f.count(os.sep), reverse=True):
+        parent, name = os.path.split(folder)
+        if name == 'archives' and parent == root:
+            continue
 
+        # Transliterate Polish characters to ASCII and replace other characters with '_'
+        normalized_name = transliterate_and_normalize(name)
+        if normalized_name != name:
             # Moving (renaming) a folder
-            old_folder_path.rename(new_folder_path)
-
-
-# Remove empty folders
-def remove_empty_folders(path):
-    for root, dirs, files in os.walk(path, topdown=False):
-        for dir in dirs:
-            folder_path = os.path.join(root, dir)
-            if not os.listdir(folder_path):
+            new_folder = os.path.join(parent, normalized_name)
+            with journal.operation('rename_folder', src=folder, dst=new_folder):
+                os.rename(folder, new_folder)
+            renames[folder] = new_folder
+
+    if not renames:
+        return list(files)
+
+    # Rewriting file paths whose folders were renamed.
+    # Renames are keyed by the original folder path, so each component is
+    # looked up against the original prefix.
+    renamed = []
+    for file_path in files:
+        *parts, file = os.path.relpath(file_path, root).split(os.sep)
+        old_folder = new_folder = root
+        for part in parts:
+            old_folder = os.path.join(old_folder, part)
+            new_folder = os.path.join(
+                new_folder, os.path.basename(renames.get(old_folder, old_folder)))
+        renamed.append(os.path.join(new_folder, file))
+    return renamed
+
+
+# Remove empty folders left behind by the given source folders
+def remove_empty_folders(path, folders, journal=NULL_JOURNAL):
+    root = os.path.normpath(path)
+    candidates = set()
+    for folder in folders:
+        folder = os.path.normpath(folder)
+        while folder != root and folder.startswith(root) and folder not in candidates:
+            candidates.add(folder)
+            folder = os.path.dirname(folder)
+
+    removed = 0
+    for folder_path in sorted(candidates, key=lambda f: f.count(os.sep), reverse=True):
+        if os.path.isdir(folder_path) and not os.listdir(folder_path):
+            with journal.operation('rmdir', path=folder_path):
                 os.rmdir(folder_path)
-                print(f"[+] Removed empty folder: {folder_path}")
-
-
-# Summary
-# 1. List of files in each category
-def list_files_in_categories(path, extensions):
-    category_files = {category: [] for category in set(extensions.values())}
-
-    for folder, _, files in os.walk(path):
-        for file in files:
-            extension = file.split('.')[-1].lower()
-            if extension in extensions:
-                folder_name = extensions[extension]
-                category_files[folder_name].append(file)
+            print(f"[+] Removed empty folder: {folder_path}")
+            removed += 1
+    return removed
 
-    print("List of files in each category:")
-    for category, files in category_files.items():
-        print(f"{category}:")
-        for file in files:
-            print(f"  {file}")
 
+# Running every stage over the given files, then summarizing them and
+# remembering them in the manifest in one final pass.
+# Stages listed in completed_stages were finished by an interrupted run and are skipped.
+def process_files(path, files, manifest, verify=False, report_files=(), rules_file=None,
+                  journal=NULL_JOURNAL, completed_stages=(), source_folders=None, profiler=None):
+    archives_folder = os.path.join(path, 'archives')
+    if source_folders is None:
+        source_folders = {os.path.dirname(file_path) for file_path in files}
+    profiler = profiler or Profiler()
+    rules = RuleSet.load(rules_file, extensions) if rules_file else RuleSet.from_extensions(extensions)
+    classifier = Classifier(rules.known_extensions, verify=verify)
+    mover = MoveEngine()
+
+    with profiler.stage('classify') as stage:
+        decisions = classify_files(files, classifier, rules)
+        categories = [decision[0] if decision else None for decision in decisions]
+        stage.files = len(files)
+    if 'organize' not in completed_stages:
+        with profiler.stage('organize') as stage:
+            organized = organize_files_by_extension_parallel(
+                files, decisions, verbose=True, mover=mover, journal=journal)
+            stage.files = sum(1 for old, new in zip(files, organized) if old != new)
+            stage.bytes_moved = sum(stats['bytes'] for stats in mover.as_dict().values())
+            files = organized
+        journal.stage_done('organize')
+    if 'normalize_files' not in completed_stages:
+        with profiler.stage('normalize_files') as stage:
+            renamed = normalize_and_rename_files(path, files, journal)
+            stage.files = sum(1 for old, new in zip(files, renamed) if old != new)
+            files = renamed
+        journal.stage_done('normalize_files')
+    if 'normalize_folders' not in completed_stages:
+        with profiler.stage('normalize_folders') as stage:
+            renamed = normalize_and_rename_folders(path, files, journal)
+            stage.files = sum(1 for old, new in zip(files, renamed) if old != new)
+            files = renamed
+        journal.stage_done('normalize_folders')
+    category_of = dict(zip(files, categories))
+    if 'unpack' not in completed_stages:
+        with profiler.stage('unpack') as stage:
+            remaining = unpack_archives(archives_folder, files, classifier, journal)
+            stage.files = len(files) - len(remaining)
+            files = remaining
+        journal.stage_done('unpack')
+    if 'remove_empty' not in completed_stages:
+        with profiler.stage('remove_empty') as stage:
+            stage.files = remove_empty_folders(path, source_folders, journal)
+        journal.stage_done('remove_empty')
+
+    with profiler.stage('report') as stage:
+        summarize(files, category_of, manifest, rules, mover, report_files)
+        stage.files = len(files)
+    journal.commit()
+    return files
+
+
+# Remembering the processed files in the manifest, then summarizing the whole
+# tree from it, so unchanged files from earlier runs are counted too
+def summarize(files, category_of, manifest, rules, mover, report_files=()):
+    report = SummaryReport(rules.categories)
+    for file_path in files:
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            manifest.discard(file_path)
+            continue
 
-# 2. List of extensions that appeared in the target directories, categorized
-def list_extensions_in_categories(path, target_categories):
-    target_categories = ['images', 'videos', 'documents', 'audio', 'archives']
-    extensions_in_target_categories = {category: []
-                                       for category in target_categories}
+        # Remembering processed entries under their final names
+        manifest.record(file_path, stat, category_of.get(file_path))
+        report.processed += 1
 
-    for category in target_categories:
-        for folder, _, files in os.walk(os.path.join(path, category)):
-            for file in files:
-                extension = file.split('.')[-1].lower()
-                if extension not in extensions_in_target_categories[category]:
-                    extensions_in_target_categories[category].append(extension)
+    for rel, size, category in manifest.items():
+        report.add(rel, category, size)
+    report.moves = mover.as_dict()
+    report.print_text()
+    for report_file in report_files:
+        report.write(report_file)
+    manifest.save()
+    return report
 
-    print("Extensions in the target categories:")
-    for category, ext_list in extensions_in_target_categories.items():
-        print(f"{category}: {', '.join(ext_list)}")
 
+# Running the program by typing python sort.py file_location or .\sort.py file_location in PowerShell.
+# By default only entries that are new or changed since the previous run are processed.
+def main(path, full=False, verify=False, report_files=(), rules_file=None, profiler=None):
+    try:
+        path = os.path.normpath(path)
+        previous = Journal.load(path)
+        if previous is not None and not previous.committed:
+            print("Poprzednie uruchomienie zostało przerwane. Użyj --resume albo --rollback.")
+            return
+
+        if rules_file:
+            try:
+                RuleSet.load(rules_file, extensions)
+            except (OSError, ValueError, TypeError, re.error) as e:
+                print(f"Niepoprawny plik reguł {rules_file}: {e}")
+                return
+
+        profiler = profiler or Profiler()
+        with profiler.stage('scan') as stage:
+            manifest = Manifest(path) if full else Manifest.load(path)
+            empty_folders = []
+            files = collect_files(path, manifest, empty_folders)
+            stage.files = len(files)
+        options = {'verify': verify, 'report_files': list(report_files),
+                   'rules_file': os.path.abspath(rules_file) if rules_file else None}
+        # Folders that were empty already are removed too, not only the ones emptied by this run
+        source_folders = {os.path.dirname(file_path) for file_path in files}.union(empty_folders)
+        journal = Journal.create(path, files, options)
+        process_files(path, files, manifest, journal=journal, source_folders=source_folders,
+                      profiler=profiler, **options)
 
-# 3. List of unrecognized extensions
-def list_unrecognized_extensions(path, extensions):
-    unrecognized_extensions = set()
+    except Exception as e:
+        logger.error(f"Wystąpił błąd: {str(e)}. Uruchom ponownie z --resume albo --rollback.")
 
-    for folder, subfolders, files in os.walk(path):
-        if "archives" in subfolders:
-            subfolders.remove("archives")
-        for file in files:
-            extension = file.split('.')[-1].lower()
-            if extension not in extensions:
-                unrecognized_extensions.add(extension)
 
-    print("Unrecognized extensions in the target folder:")
-    for ext in unrecognized_extensions:
-        print(f"  {ext}")
+# Continuing an interrupted run from the journal; finished operations are not repeated
+def resume(path, profiler=None):
+    path = os.path.normpath(path)
+    journal = Journal.load(path)
+    if journal is None or journal.committed:
+        print("Brak przerwanego uruchomienia do wznowienia.")
+        return
 
+    try:
+        files = journal.current_files()
+        source_folders = {os.path.dirname(file_path) for file_path in journal.begin['files']}
+        journal.reopen()
+        process_files(path, files, Manifest.load(path), journal=journal,
+                      completed_stages=journal.stages, source_folders=source_folders, profiler=profiler,
+                      **journal.begin['options'])
 
-# Running the program by typing python sort.py file_location or .\sort.py file_location in PowerShell
-def main(path):
-    target_categories = ['images', 'videos', 'documents', 'audio', 'archives']
+    except Exception as e:
+        logger.error(f"Wystąpił błąd: {str(e)}. Uruchom ponownie z --resume albo --rollback.")
 
-    try:
-        archives_folder = os.path.join(path, 'archives')
 
-        organize_files_by_extension_parallel(path, extensions, verbose=True)
-        normalize_and_rename_files(path)
-        normalize_and_rename_folders(path)
-        unpack_archives(archives_folder, path)
-        remove_empty_folders(path)
-        list_files_in_categories(path, extensions)
-        list_extensions_in_categories(path, target_categories)
-        list_unrecognized_extensions(path, extensions)
+# Undoing the last run (interrupted or finished) from the journal
+def rollback(path):
+    path = os.path.normpath(path)
+    journal = Journal.load(path)
+    if journal is None:
+        print("Brak zapisu uruchomienia do cofnięcia.")
+        return
 
-    except Exception as e:
-        logger.error(f"Wystąpił błąd: {str(e)}")
+    # Entries recorded under their new names would be skipped by the next run
+    manifest = Manifest.load(path)
+    for file_path in journal.current_files():
+        manifest.discard(file_path)
+    journal.rollback()
+    manifest.save()
+    print("Cofnięto zmiany z ostatniego uruchomienia.")
 
 
 def clean_and_organize_folder():
-    if len(sys.argv) != 2:
-        print("Użycie: clean-folder <ścieżka_do_folderu>")
-        sys.exit(1)
-
-    folder_path = sys.argv[1]
+    parser = argparse.ArgumentParser(
+        prog='clean-folder', description='Porządkowanie plików według ich typu.')
+    parser.add_argument('path', help='Ścieżka do folderu.')
+    parser.add_argument('--full', action='store_true',
+                        help='Przetwórz wszystkie pliki, ignorując zapis z poprzedniego uruchomienia.')
+    parser.add_argument('--sniff', action='store_true',
+                        help='Sprawdzaj nagłówek każdego pliku, a nie tylko plików o nieznanym rozszerzeniu.')
+    parser.add_argument('--rules', metavar='PLIK',
+                        help='Własne reguły kategorii w pliku .json lub .toml.')
+    parser.add_argument('--report', action='append', default=[], metavar='PLIK',
+                        help='Zapisz podsumowanie do pliku .json lub .csv (można podać kilka razy).')
+    parser.add_argument('--profile', action='store_true',
+                        help='Wypisz czas, liczbę plików i wywołań systemowych dla każdego etapu.')
+    parser.add_argument('--metrics', metavar='PLIK',
+                        help='Zapisz metryki etapów do pliku .json (lub dopisz do pliku .jsonl).')
+    parser.add_argument('--profile-stage', metavar='ETAP',
+                        choices=['scan', 'classify', 'organize', 'normalize_files', 'normalize_folders',
+                                 'unpack', 'remove_empty', 'report'],
+                        help='Uruchom wybrany etap pod cProfile (wynik w clean_folder_<etap>.prof).')
+    parser.add_argument('--resume', action='store_true',
+                        help='Dokończ przerwane uruchomienie na podstawie dziennika operacji.')
+    parser.add_argument('--rollback', action='store_true',
+                        help='Cofnij zmiany z ostatniego uruchomienia.')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Potok asyncio dla wolnych dysków sieciowych (NFS, SMB), bez dziennika operacji.')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='Liczba jednoczesnych operacji na plikach w trybie --async.')
+    parser.add_argument('--watch', action='store_true',
+                        help='Pozostań uruchomiony i porządkuj nowe pliki na bieżąco.')
+    parser.add_argument('--poll', action='store_true',
+                        help='W trybie --watch odpytuj folder zamiast używać inotify.')
+    parser.add_argument('--debounce', type=float, default=1.0,
+                        help='Czas ciszy (w sekundach) przed przetworzeniem paczki zdarzeń.')
+    args = parser.parse_args()
+    if args.use_async and args.watch:
+        parser.error('--watch nie działa razem z --async.')
+
+    folder_path = args.path
 
     if not os.path.exists(folder_path):
         print(f"Folder {folder_path} nie istnieje.")
         sys.exit(1)
 
-    main(folder_path)
+    profiler = Profiler(
+        count_calls=args.profile or bool(args.metrics), profile_stage=args.profile_stage,
+        profile_file=f"clean_folder_{args.profile_stage}.prof" if args.profile_stage else None)
+
+    if args.resume:
+        resume(folder_path, profiler=profiler)
+    elif args.rollback:
+        rollback(folder_path)
+    elif args.use_async:
+        # Imported here because the asyncio pipeline itself builds on this module
+        from .async_clean import main_async
+        main_async(folder_path, concurrency=args.concurrency, verify=args.sniff,
+                   rules_file=args.rules, full=args.full, report_files=args.report, profiler=profiler)
+    elif args.watch:
+        # Imported here because the watcher itself builds on this module
+        from .watch import watch_folder
+        watch_folder(folder_path, debounce=args.debounce, poll=args.poll,
+                     verify=args.sniff, rules_file=args.rules,
+                     initial_run=lambda: main(folder_path, full=args.full, verify=args.sniff,
+                                              report_files=args.report, rules_file=args.rules,
+                                              profiler=profiler))
+    else:
+        main(folder_path, full=args.full, verify=args.sniff, report_files=args.report,
+             rules_file=args.rules, profiler=profiler)
+
+    if args.profile or args.profile_stage:
+        profiler.print_report()
+    if args.metrics:
+        profiler.write(args.metrics, path=os.path.abspath(folder_path))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+from .manifest import INTERNAL_PREFIX
+
+
+JOURNAL_NAME = f'{INTERNAL_PREFIX}journal.jsonl'
+TRASH_NAME = f'{INTERNAL_PREFIX}trash'
+
+STAGES = ['organize', 'normalize_files', 'normalize_folders', 'unpack', 'remove_empty']
+
+
+# Journal of the operations done by a single run, one JSON record per line:
+# {"begin": ...}, {"plan": id, "op": ..., args}, {"done": id}, {"stage": name}, {"commit": true}.
+# Every operation is written before it starts and again once it finished, so an
+# interrupted run can be resumed or rolled back. Archives are moved to a trash
+# folder instead of being deleted, so a rollback can bring them back.
+class Journal:
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, JOURNAL_NAME)
+        self.trash_folder = os.path.join(root, TRASH_NAME)
+        self.lock = threading.Lock()
+        self.file = None
+        self.next_id = 0
+        self.begin = None
+        self.operations = []
+        self.done_ids = set()
+        self.stages = []
+        self.committed = False
+
+    # Starting a new run; the journal and trash of the previous run are discarded
+    @classmethod
+    def create(cls, root, files, options):
+        journal = cls(root)
+        shutil.rmtree(journal.trash_folder, ignore_errors=True)
+        journal.file = open(journal.path, 'w', encoding='utf-8')
+        journal.begin = {'files': list(files), 'options': options}
+        journal.write({'begin': journal.begin}, sync=True)
+        return journal
+
+    @classmethod
+    def load(cls, root):
+        journal = cls(root)
+        try:
+            with open(journal.path, 'r', encoding='utf-8') as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return None
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may be cut short by a crash
+                continue
+            if 'begin' in record:
+                journal.begin = record['begin']
+            elif 'plan' in record:
+                journal.operations.append(record)
+                journal.next_id = max(journal.next_id, record['plan'] + 1)
+            elif 'done' in record:
+                journal.done_ids.add(record['done'])
+            elif 'stage' in record:
+                journal.stages.append(record['stage'])
+            elif 'commit' in record:
+                journal.committed = True
+        if journal.begin is None:
+            return None
+        return journal
+
+    def write(self, record, sync=False):
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @contextmanager
+    def operation(self, op, **args):
+        with self.lock:
+            op_id = self.next_id
+            self.next_id += 1
+        self.write(dict(args, plan=op_id, op=op))
+        yield op_id
+        self.write({'done': op_id})
+
+    def stage_done(self, stage):
+        self.write({'stage': stage}, sync=True)
+
+    def commit(self):
+        self.write({'commit': True}, sync=True)
+        self.close()
+
+    # Archives are kept in the trash until the next run starts
+    def discard(self, file_path, op_id):
+        os.makedirs(self.trash_folder, exist_ok=True)
+        os.rename(file_path, self.trash_path(file_path, op_id))
+
+    def trash_path(self, file_path, op_id):
+        return os.path.join(self.trash_folder, f'{op_id}_{os.path.basename(file_path)}')
+
+    # Checking an operation that was started but not marked as done.
+    # Half-extracted archives are removed so the unpacking can start over.
+    def finished(self, record):
+        if record['plan'] in self.done_ids:
+            return True
+        op = record['op']
+        if op in ('move', 'rename', 'rename_folder'):
+            return not os.path.exists(record['src']) and os.path.exists(record['dst'])
+        if op == 'unpack':
+            trash_path = self.trash_path(record['archive'], record['plan'])
+            if os.path.exists(trash_path) and not os.path.exists(record['archive']):
+                return True
+            shutil.rmtree(record['dest'], ignore_errors=True)
+            return False
+        if op == 'mkdir':
+            return os.path.isdir(record['path'])
+        if op == 'rmdir':
+            return not os.path.exists(record['path'])
+        return False
+
+    # Replaying the journal to find where every file of the run is now
+    def current_files(self):
+        files = list(self.begin['files'])
+        index = {file_path: position for position, file_path in enumerate(files)}
+
+        for record in self.operations:
+            if not self.finished(record):
+                continue
+            op = record['op']
+            if op in ('move', 'rename') and record['src'] in index:
+                position = index.pop(record['src'])
+                files[position] = record['dst']
+                index[record['dst']] = position
+            elif op == 'rename_folder':
+                prefix = record['src'] + os.sep
+                for file_path in [f for f in index if f.startswith(prefix)]:
+                    position = index.pop(file_path)
+                    files[position] = record['dst'] + file_path[len(record['src']):]
+                    index[files[position]] = position
+            elif op == 'unpack' and record['archive'] in index:
+                files[index.pop(record['archive'])] = None
+        return [file_path for file_path in files if file_path is not None]
+
+    def reopen(self):
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    # Undoing every finished operation, newest first
+    def rollback(self):
+        for record in reversed(self.operations):
+            if not self.finished(record):
+                continue
+            op = record['op']
+            if op in ('move', 'rename', 'rename_folder'):
+                if os.path.exists(record['dst']) and not os.path.exists(record['src']):
+                    os.makedirs(os.path.dirname(record['src']), exist_ok=True)
+                    os.rename(record['dst'], record['src'])
+            elif op == 'unpack':
+                shutil.rmtree(record['dest'], ignore_errors=True)
+                trash_path = self.trash_path(record['archive'], record['plan'])
+                if os.path.exists(trash_path):
+                    os.rename(trash_path, record['archive'])
+            elif op == 'mkdir':
+                try:
+                    os.rmdir(record['path'])
+                except OSError:
+                    pass
+            elif op == 'rmdir':
+                os.makedirs(record['path'], exist_ok=True)
+
+        self.remove()
+
+    def remove(self):
+        self.close()
+        shutil.rmtree(self.trash_folder, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Stand-in used when no journal is kept (e.g. in watch mode)
+class NullJournal:
+    @contextmanager
+    def operation(self, op, **args):
+        yield None
+
+    def stage_done(self, stage):
+        pass
+
+    def commit(self):
+        pass
+
+    def discard(self, file_path, op_id):
+        os.remove(file_path)
+
+
+NULL_JOURNAL = NullJournal()
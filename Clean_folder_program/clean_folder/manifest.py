@@ -0,0 +1,85 @@
+import json
+import os
+
+
+# Files and folders the program keeps in the target directory start with this prefix
+INTERNAL_PREFIX = '.clean_folder_'
+MANIFEST_NAME = f'{INTERNAL_PREFIX}manifest.json'
+
+
+# Record of entries already processed in the target directory,
+# stored as {relative_path: [mtime_ns, size, category]}
+class Manifest:
+    def __init__(self, root, entries=None):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        # Paths under the root are turned into relative ones by slicing off this prefix
+        self.prefix = os.path.join(os.path.normpath(root), '')
+        # A manifest that was not loaded from disk is always written
+        self.changed = entries is None
+        self.entries = entries if entries is not None else {}
+
+    @classmethod
+    def load(cls, root):
+        path = os.path.join(root, MANIFEST_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            # Missing or damaged manifest means everything is treated as new
+            entries = {}
+        return cls(root, entries)
+
+    # os.path.relpath costs microseconds per call, which adds up to seconds on big trees
+    def relpath(self, file_path):
+        if file_path.startswith(self.prefix):
+            return file_path[len(self.prefix):]
+        return os.path.relpath(file_path, self.root)
+
+    # An entry is unchanged when both its mtime and size match the previous run.
+    # Entries from older manifests have no category yet, so they are processed once more.
+    def is_changed(self, file_path, stat):
+        known = self.entries.get(self.relpath(file_path))
+        return (known is None or len(known) < 3
+                or known[0] != stat.st_mtime_ns or known[1] != stat.st_size)
+
+    def record(self, file_path, stat=None, category=None):
+        if stat is None:
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                self.discard(file_path)
+                return
+        entry = [stat.st_mtime_ns, stat.st_size, category]
+        rel = self.relpath(file_path)
+        if self.entries.get(rel) != entry:
+            self.entries[rel] = entry
+            self.changed = True
+
+    # (relative path, size, category) of every entry, for totals over the whole tree
+    def items(self):
+        for rel, (_, size, *category) in self.entries.items():
+            yield rel, size, category[0] if category else None
+
+    def discard(self, file_path):
+        if self.entries.pop(self.relpath(file_path), None) is not None:
+            self.changed = True
+
+    # Drop entries that no longer exist in the tree
+    def prune(self, seen_paths):
+        seen = {self.relpath(file_path) for file_path in seen_paths}
+        kept = {rel: value for rel, value in self.entries.items() if rel in seen}
+        if len(kept) != len(self.entries):
+            self.entries = kept
+            self.changed = True
+
+    # Write to a temporary file first so an interrupted save never corrupts the manifest.
+    # An unchanged manifest is not rewritten.
+    def save(self):
+        if not self.changed:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self.changed = False
@@ -0,0 +1,156 @@
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+# Audit events (PEP 578) counted as filesystem calls while a stage runs.
+# zipfile and tarfile raise no events of their own, so extracting an archive
+# shows up only through the open and os.* calls it makes.
+AUDITED_EVENTS = {'open', 'os.rename', 'os.remove', 'os.rmdir', 'os.mkdir', 'os.listdir',
+                  'os.scandir', 'os.chmod', 'os.utime', 'shutil.move', 'shutil.copyfile',
+                  'shutil.rmtree'}
+
+_audit_counters = []
+_audit_lock = threading.Lock()
+_audit_hook_installed = False
+
+
+def _audit_hook(event, args):
+    if _audit_counters and event in AUDITED_EVENTS:
+        with _audit_lock:
+            for counter in _audit_counters:
+                counter[event] += 1
+
+
+def install_audit_hook():
+    # Audit hooks cannot be removed, so a single hook is installed and feeds
+    # whichever stages are currently being measured
+    global _audit_hook_installed
+    if not _audit_hook_installed:
+        sys.addaudithook(_audit_hook)
+        _audit_hook_installed = True
+
+
+# Kernel-side counters: read/write syscalls from /proc (Linux) and block I/O from getrusage
+def io_counters():
+    counters = {}
+    try:
+        with open('/proc/self/io', 'r') as file:
+            for line in file:
+                key, value = line.split(':')
+                if key in ('syscr', 'syscw', 'read_bytes', 'write_bytes'):
+                    counters[key] = int(value)
+    except OSError:
+        pass
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        counters['blocks_in'] = usage.ru_inblock
+        counters['blocks_out'] = usage.ru_oublock
+    return counters
+
+
+# `errors` counts an exception that aborted the stage, plus the per-file errors
+# the stage itself adds (the asyncio pipeline logs those and carries on)
+class StageMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.files = 0
+        self.bytes_moved = 0
+        self.errors = 0
+        self.calls = Counter()
+        self.io = {}
+
+    def as_dict(self):
+        return {'stage': self.name, 'seconds': round(self.seconds, 6), 'files': self.files,
+                'bytes_moved': self.bytes_moved, 'errors': self.errors,
+                'calls': dict(self.calls), 'io': self.io}
+
+
+# Collecting wall time, files, bytes, filesystem calls and errors for every stage.
+# One stage can additionally be run under cProfile.
+class Profiler:
+    def __init__(self, count_calls=False, profile_stage=None, profile_file=None):
+        self.stages = []
+        self.count_calls = count_calls
+        self.profile_stage = profile_stage
+        self.profile_file = profile_file
+        self.profile_text = None
+        if count_calls:
+            install_audit_hook()
+
+    @contextmanager
+    def stage(self, name):
+        metrics = StageMetrics(name)
+        self.stages.append(metrics)
+        io_before = io_counters()
+        if self.count_calls:
+            with _audit_lock:
+                _audit_counters.append(metrics.calls)
+        profile = cProfile.Profile() if name == self.profile_stage else None
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield metrics
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+                self.save_profile(profile)
+            metrics.seconds = time.perf_counter() - start
+            if self.count_calls:
+                with _audit_lock:
+                    _audit_counters.remove(metrics.calls)
+            io_after = io_counters()
+            metrics.io = {key: io_after[key] - io_before.get(key, 0) for key in io_after}
+
+    def save_profile(self, profile):
+        if self.profile_file:
+            profile.dump_stats(self.profile_file)
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(15)
+        self.profile_text = output.getvalue()
+
+    def as_dict(self):
+        return {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'total_seconds': round(sum(stage.seconds for stage in self.stages), 6),
+            'stages': [stage.as_dict() for stage in self.stages],
+        }
+
+    def print_report(self):
+        print("Stage profile:")
+        print(f"  {'stage':<18} {'seconds':>10} {'files':>9} {'bytes moved':>13} {'fs calls':>9} "
+              f"{'syscr':>9} {'syscw':>9} {'errors':>6}")
+        for stage in self.stages:
+            print(f"  {stage.name:<18} {stage.seconds:>10.3f} {stage.files:>9} {stage.bytes_moved:>13} "
+                  f"{sum(stage.calls.values()):>9} {stage.io.get('syscr', 0):>9} "
+                  f"{stage.io.get('syscw', 0):>9} {stage.errors:>6}")
+        if self.profile_text:
+            print(f"cProfile of stage {self.profile_stage}:")
+            print(self.profile_text)
+
+    # A .jsonl file gets one line appended per run, so runs can be compared over time
+    def write(self, filename, **extra):
+        data = dict(self.as_dict(), **extra)
+        if filename.lower().endswith('.jsonl'):
+            with open(filename, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(data) + '\n')
+        else:
+            with open(filename, 'w', encoding='utf-8') as file:
+                json.dump(data, file, indent=4)
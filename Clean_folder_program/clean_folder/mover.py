@@ -0,0 +1,111 @@
+import errno
+import os
+import shutil
+import threading
+import time
+
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+# Copying file contents inside the kernel: copy_file_range first, sendfile if the
+# filesystem does not support it, plain read/write as the last resort
+def copy_file_contents(src_fd, dst_fd, size):
+    copied = 0
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    while copy_file_range is not None and copied < size:
+        try:
+            sent = copy_file_range(src_fd, dst_fd, min(CHUNK_SIZE, size - copied))
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+            break
+        if sent == 0:
+            break
+        copied += sent
+
+    while hasattr(os, 'sendfile') and copied < size:
+        try:
+            sent = os.sendfile(dst_fd, src_fd, copied, min(CHUNK_SIZE, size - copied))
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL):
+                raise
+            break
+        if sent == 0:
+            break
+        copied += sent
+
+    if copied < size:
+        os.lseek(src_fd, copied, os.SEEK_SET)
+        os.lseek(dst_fd, copied, os.SEEK_SET)
+        while True:
+            data = os.read(src_fd, min(CHUNK_SIZE, 1024 * 1024))
+            if not data:
+                break
+            os.write(dst_fd, data)
+            copied += len(data)
+    return copied
+
+
+# Moving a file across filesystems: the source is deleted only after the copy
+# has the expected size and has been flushed to disk
+def copy_and_delete(src, dst):
+    stat = os.stat(src)
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.st_mode & 0o777)
+        try:
+            copied = copy_file_contents(src_fd, dst_fd, stat.st_size)
+            os.fsync(dst_fd)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    if copied != stat.st_size or os.stat(dst).st_size != stat.st_size:
+        os.remove(dst)
+        raise OSError(errno.EIO, f'Copy of {src} is incomplete ({copied} of {stat.st_size} bytes)')
+    shutil.copystat(src, dst)
+    os.remove(src)
+    return stat.st_size
+
+
+# Moving files with os.rename, falling back to a zero-copy transfer when the
+# destination is on another device; bytes and time are collected per category
+class MoveEngine:
+    def __init__(self, workers=None):
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def move(self, src, dst, category=None):
+        start = time.perf_counter()
+        try:
+            size = os.stat(src).st_size
+            os.rename(src, dst)
+            cross_device = False
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            if os.path.isdir(src):
+                shutil.move(src, dst)
+                size = 0
+            else:
+                size = copy_and_delete(src, dst)
+            cross_device = True
+        self.account(category, size, time.perf_counter() - start, cross_device)
+        return dst
+
+    def account(self, category, size, elapsed, cross_device):
+        with self.lock:
+            stats = self.stats.setdefault(category or 'other', {
+                'files': 0, 'bytes': 0, 'seconds': 0.0, 'cross_device': 0})
+            stats['files'] += 1
+            stats['bytes'] += size
+            stats['seconds'] += elapsed
+            stats['cross_device'] += cross_device
+
+    def as_dict(self):
+        with self.lock:
+            return {category: dict(stats, mb_per_second=round(
+                        stats['bytes'] / stats['seconds'] / 1e6, 2) if stats['seconds'] else None)
+                    for category, stats in self.stats.items()}
@@ -0,0 +1,82 @@
+import csv
+import json
+import os
+from collections import Counter
+
+
+# Summary built in a single pass: per category only counters are kept
+# (files, bytes, extensions), so memory does not grow with the number of files.
+# The counters cover the whole folder, `processed` only the files of this run.
+class SummaryReport:
+    def __init__(self, categories):
+        self.categories = {category: {'files': 0, 'bytes': 0, 'extensions': Counter()}
+                           for category in categories}
+        self.unrecognized = Counter()
+        self.processed = 0
+        self.moves = {}
+
+    def add(self, file_path, category, size):
+        name = os.path.basename(file_path)
+        extension = name.split('.')[-1].lower() if '.' in name.lstrip('.') else ''
+        if category is None:
+            self.unrecognized[extension] += 1
+            return
+        counters = self.categories.setdefault(
+            category, {'files': 0, 'bytes': 0, 'extensions': Counter()})
+        counters['files'] += 1
+        counters['bytes'] += size
+        counters['extensions'][extension] += 1
+
+    def as_dict(self):
+        return {
+            'categories': {category: {'files': counters['files'],
+                                      'bytes': counters['bytes'],
+                                      'extensions': dict(counters['extensions'])}
+                           for category, counters in self.categories.items()},
+            'unrecognized_extensions': dict(self.unrecognized),
+            'processed_this_run': self.processed,
+            'moves': self.moves,
+        }
+
+    def print_text(self):
+        print(f"Files processed in this run: {self.processed}")
+        print("Files in each category (whole folder):")
+        for category, counters in self.categories.items():
+            extensions = ', '.join(f"{extension or '(none)'}: {count}"
+                                   for extension, count in counters['extensions'].most_common())
+            print(f"{category}: {counters['files']} files, {counters['bytes']} bytes"
+                  + (f" ({extensions})" if extensions else ''))
+
+        print("Unrecognized extensions in the target folder:")
+        for extension, count in self.unrecognized.most_common():
+            print(f"  {extension or '(none)'}: {count}")
+
+        if self.moves:
+            print("Move throughput per category:")
+        for category, stats in self.moves.items():
+            speed = f"{stats['mb_per_second']} MB/s" if stats['mb_per_second'] is not None else '-'
+            print(f"  {category}: {stats['files']} files, {stats['bytes']} bytes "
+                  f"({stats['cross_device']} across devices), {speed}")
+
+    def write_json(self, filename):
+        with open(filename, 'w', encoding='utf-8') as file:
+            json.dump(self.as_dict(), file, indent=4)
+
+    # One row per category, plus one row per unrecognized extension
+    def write_csv(self, filename):
+        with open(filename, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['category', 'files', 'bytes', 'extensions'])
+            for category, counters in self.categories.items():
+                extensions = ';'.join(f"{extension}:{count}"
+                                      for extension, count in counters['extensions'].items())
+                writer.writerow([category, counters['files'], counters['bytes'], extensions])
+            for extension, count in self.unrecognized.items():
+                writer.writerow(['unrecognized', count, '', f"{extension}:{count}"])
+
+    # The format is picked from the file suffix (.json or .csv)
+    def write(self, filename):
+        if filename.lower().endswith('.csv'):
+            self.write_csv(filename)
+        else:
+            self.write_json(filename)
@@ -0,0 +1,227 @@
+import fnmatch
+import json
+import os
+import re
+import time
+
+
+DEFAULT_DESTINATION = '{category}'
+SECONDS_PER_DAY = 24 * 60 * 60
+# Sample values for checking destination templates when the rules are loaded
+SAMPLE_FIELDS = {'ext': 'ext', 'year': '2000', 'month': '01', 'day': '01'}
+
+RULE_KEYS = {'category', 'glob', 'regex', 'extensions', 'min_size', 'max_size',
+             'min_age_days', 'max_age_days', 'destination'}
+
+
+# A single user rule. Every given predicate must hold for the rule to apply.
+# `destination` is a folder template relative to the file's folder, e.g.
+# "{category}/{year}-{month}"; available fields: category, ext, year, month, day.
+class Rule:
+    def __init__(self, category, glob=None, regex=None, extensions=None, min_size=None,
+                 max_size=None, min_age_days=None, max_age_days=None,
+                 destination=DEFAULT_DESTINATION):
+        self.category = category
+        self.glob = glob
+        self.regex = re.compile(regex) if regex else None
+        self.extensions = {extension.lower().lstrip('.') for extension in extensions or ()}
+        self.min_size = min_size
+        self.max_size = max_size
+        self.min_age_days = min_age_days
+        self.max_age_days = max_age_days
+        self.destination = destination
+        # A bad template fails here rather than half-way through a run
+        self.render_destination(dict(SAMPLE_FIELDS, category=category))
+
+    @property
+    def needs_stat(self):
+        return (self.min_size, self.max_size, self.min_age_days, self.max_age_days) != (None,) * 4 \
+            or any(field in self.destination for field in ('{year', '{month', '{day'))
+
+    # Pattern used in the combined name regex: the glob when present, otherwise the regex
+    def name_pattern(self):
+        if self.glob:
+            return f'(?i:{fnmatch.translate(self.glob)})'
+        if self.regex:
+            return f'(?:{self.regex.pattern})'
+        return None
+
+    # Regexes with their own groups or inline global flags (e.g. "(?i)") are matched on
+    # their own: joined into one alternation their groups get renumbered, and a global
+    # flag is only allowed at the very start of the pattern
+    @property
+    def standalone_regex(self):
+        if self.glob or not self.regex:
+            return False
+        return bool(self.regex.groups or self.regex.flags & ~re.UNICODE)
+
+    # Predicates not covered by the extension index and the combined name regex
+    def matches_rest(self, name, extension, get_stat):
+        if self.glob and self.regex and not self.regex.match(name):
+            return False
+        if self.extensions and extension not in self.extensions:
+            return False
+        if not self.needs_stat:
+            return True
+
+        stat = get_stat()
+        if stat is None:
+            return False
+        if self.min_size is not None and stat.st_size < self.min_size:
+            return False
+        if self.max_size is not None and stat.st_size > self.max_size:
+            return False
+        age_days = (time.time() - stat.st_mtime) / SECONDS_PER_DAY
+        if self.min_age_days is not None and age_days < self.min_age_days:
+            return False
+        if self.max_age_days is not None and age_days > self.max_age_days:
+            return False
+        return True
+
+    def destination_for(self, extension, get_stat):
+        fields = {'category': self.category, 'ext': extension or 'none'}
+        if any(field in self.destination for field in ('{year', '{month', '{day')):
+            stat = get_stat()
+            modified = time.localtime(stat.st_mtime if stat else time.time())
+            fields.update(year=f'{modified.tm_year:04d}', month=f'{modified.tm_mon:02d}',
+                          day=f'{modified.tm_mday:02d}')
+        return self.render_destination(fields)
+
+    def render_destination(self, fields):
+        try:
+            destination = os.path.normpath(self.destination.format(**fields))
+        except KeyError as e:
+            raise ValueError(f'Destination {self.destination!r} has an unknown field {e}')
+        except (IndexError, ValueError) as e:
+            raise ValueError(f'Destination {self.destination!r} is not a valid template: {e}')
+        if os.path.isabs(destination) or destination.split(os.sep)[0] == '..':
+            raise ValueError(f'Destination {self.destination!r} must stay inside the folder')
+        return destination
+
+
+# Rules compiled into one decision structure: rules keyed only by extension go
+# into a hash index, rules with a name pattern into one combined regex, so
+# matching a file costs a dict lookup and a single regex match whatever the
+# number of rules. Regexes that cannot be joined (see Rule.standalone_regex) are
+# matched one by one. The first rule (in file order) that matches wins.
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.by_extension = {}
+        self.name_rules = []
+        self.regex_rules = []
+        self.other_rules = []
+
+        patterns = []
+        for index, rule in enumerate(self.rules):
+            pattern = rule.name_pattern()
+            if rule.standalone_regex:
+                self.regex_rules.append(index)
+            elif pattern is not None:
+                self.name_rules.append(index)
+                patterns.append(f'(?P<r{index}>{pattern})')
+            elif rule.extensions:
+                for extension in rule.extensions:
+                    self.by_extension.setdefault(extension, []).append(index)
+            else:
+                self.other_rules.append(index)
+        self.name_regex = re.compile('|'.join(patterns)) if patterns else None
+
+    # The built-in `extensions` dict expressed as rules
+    @classmethod
+    def from_extensions(cls, extensions):
+        return cls(cls.extension_rules(extensions))
+
+    @staticmethod
+    def extension_rules(extensions):
+        by_category = {}
+        for extension, category in extensions.items():
+            by_category.setdefault(category, []).append(extension)
+        return [Rule(category, extensions=category_extensions)
+                for category, category_extensions in by_category.items()]
+
+    # Loading user rules from a .json or .toml file; they are checked before the
+    # built-in extension rules unless the file sets "replace_defaults = true"
+    @classmethod
+    def load(cls, filename, extensions):
+        if filename.lower().endswith('.toml'):
+            try:
+                import tomllib
+            except ImportError:
+                raise ValueError('TOML rules need Python 3.11 or newer, use JSON instead')
+            with open(filename, 'rb') as file:
+                config = tomllib.load(file)
+        else:
+            with open(filename, 'r', encoding='utf-8') as file:
+                config = json.load(file)
+
+        rules = []
+        for number, options in enumerate(config.get('rules', []), start=1):
+            unknown = set(options) - RULE_KEYS
+            if 'category' not in options or unknown:
+                raise ValueError(f'Rule {number} in {filename} needs a "category"'
+                                 + (f' and has unknown keys: {", ".join(sorted(unknown))}' if unknown else ''))
+            try:
+                rules.append(Rule(**options))
+            except re.error as e:
+                raise ValueError(f'Rule {number} in {filename} has an invalid regex: {e}')
+            except ValueError as e:
+                raise ValueError(f'Rule {number} in {filename}: {e}')
+        if not config.get('replace_defaults', False):
+            rules.extend(cls.extension_rules(extensions))
+        return cls(rules)
+
+    # Extensions the rules know about; others are identified from the file header
+    @property
+    def known_extensions(self):
+        return set().union(*(rule.extensions for rule in self.rules))
+
+    @property
+    def categories(self):
+        return list(dict.fromkeys(rule.category for rule in self.rules))
+
+    def first_match(self, candidates, name, extension, get_stat):
+        for index in candidates:
+            if self.rules[index].matches_rest(name, extension, get_stat):
+                return index
+        return None
+
+    # Returns (category, destination folder relative to the file's folder) or None.
+    # `extension` is the classified kind used by the "extensions" predicate, while
+    # {ext} in destinations is the extension in the name (name_extension) when it has one.
+    def match(self, file_path, extension, stat=None, name_extension=None):
+        name = os.path.basename(file_path)
+        cache = [stat]
+
+        def get_stat():
+            if cache[0] is None:
+                try:
+                    cache[0] = os.stat(file_path)
+                except OSError:
+                    return None
+            return cache[0]
+
+        found = []
+        if self.name_regex is not None:
+            match = self.name_regex.match(name)
+            if match is not None:
+                index = int(match.lastgroup[1:])
+                if self.rules[index].matches_rest(name, extension, get_stat):
+                    found.append(index)
+                else:
+                    # Rare slow path: the first rule matching by name failed another predicate
+                    later = [i for i in self.name_rules if i > index
+                             and re.match(self.rules[i].name_pattern(), name)]
+                    index = self.first_match(later, name, extension, get_stat)
+                    if index is not None:
+                        found.append(index)
+        named = [i for i in self.regex_rules if self.rules[i].regex.match(name)]
+        for candidates in (named, self.by_extension.get(extension, ()), self.other_rules):
+            index = self.first_match(candidates, name, extension, get_stat)
+            if index is not None:
+                found.append(index)
+
+        if not found:
+            return None
+        rule = self.rules[min(found)]
+        return rule.category, rule.destination_for(name_extension or extension, get_stat)
@@ -0,0 +1,216 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from .clean import collect_files, process_files
+from .manifest import Manifest, INTERNAL_PREFIX
+
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+# Thin ctypes wrapper over Linux inotify, watching a whole tree.
+# Subfolders of the "archives" folder hold unpacked content and are not watched.
+class InotifyWatcher:
+    def __init__(self, root):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or libc_name is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.root = root
+        self.archives_folder = os.path.join(root, 'archives')
+        self.folders = {}
+        self.overflowed = False
+
+    def close(self):
+        os.close(self.fd)
+
+    def add_watch(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            logger.warning(f'Cannot watch {folder}: {os.strerror(err)}')
+            return
+        self.folders[wd] = folder
+
+    # Watching a folder with all its subfolders and returning the files already inside,
+    # since they may have arrived before the watch was in place
+    def add_tree(self, folder):
+        found = []
+        for current, subfolders, files in os.walk(folder):
+            self.add_watch(current)
+            if current == self.archives_folder:
+                subfolders[:] = []
+            found.extend(os.path.join(current, file) for file in files)
+        return found
+
+    # Waiting up to timeout seconds (None means forever) and returning paths of
+    # files that were written, created or moved in
+    def read_events(self, timeout=None):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        paths = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    self.overflowed = True
+                    continue
+                if mask & IN_IGNORED:
+                    self.folders.pop(wd, None)
+                    continue
+                folder = self.folders.get(wd)
+                if folder is None or not name:
+                    continue
+                path = os.path.join(folder, name)
+                if mask & IN_ISDIR:
+                    if folder != self.archives_folder:
+                        paths.extend(self.add_tree(path))
+                else:
+                    paths.append(path)
+        return paths
+
+
+# Keeping only regular files that were not processed yet
+def filter_pending(root, paths, manifest):
+    archives_folder = os.path.join(root, 'archives')
+    pending = []
+    for file_path in paths:
+        if any(part.startswith(INTERNAL_PREFIX) for part in os.path.relpath(file_path, root).split(os.sep)):
+            continue
+        if os.path.dirname(file_path).startswith(archives_folder + os.sep):
+            continue
+        try:
+            stat = os.stat(file_path, follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        if os.path.isfile(file_path) and manifest.is_changed(file_path, stat):
+            pending.append(file_path)
+    return pending
+
+
+def process_batch(root, files, manifest, options):
+    if not files:
+        return
+    logger.info(f'Processing {len(files)} new file(s)')
+    try:
+        process_files(root, files, manifest, **options)
+    except Exception as e:
+        logger.error(f"Wystąpił błąd: {str(e)}")
+
+
+# Collecting events until the folder stays quiet for `debounce` seconds
+# (or `max_delay` passes), then processing the whole batch at once.
+# `initial` holds files found when the watch was set up; those not in the manifest
+# arrived during the initial run and form the first batch.
+def watch_with_inotify(root, watcher, manifest, debounce, max_delay, options, initial=()):
+    pending = set(initial)
+    first_event = time.monotonic() if pending else None
+
+    while True:
+        paths = watcher.read_events(debounce if pending else None)
+        now = time.monotonic()
+        if paths:
+            pending.update(paths)
+            first_event = first_event or now
+            if now - first_event < max_delay and not watcher.overflowed:
+                continue
+        if not pending and not watcher.overflowed:
+            continue
+
+        if watcher.overflowed:
+            # Events were lost, so the manifest decides what is new
+            logger.warning('inotify queue overflowed, rescanning the folder')
+            watcher.overflowed = False
+            files = collect_files(root, manifest)
+        else:
+            files = filter_pending(root, pending, manifest)
+        pending.clear()
+        first_event = None
+        process_batch(root, files, manifest, options)
+
+
+# Polling fallback: files are processed once they are unchanged between two scans
+def watch_with_polling(root, manifest, interval, options):
+    previous = {}
+    while True:
+        current = {}
+        for file_path in collect_files(root, manifest):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            current[file_path] = (stat.st_mtime_ns, stat.st_size)
+
+        ready = [file_path for file_path, state in current.items()
+                 if previous.get(file_path) == state]
+        previous = {file_path: state for file_path, state in current.items()
+                    if file_path not in ready}
+        process_batch(root, ready, manifest, options)
+        time.sleep(interval)
+
+
+# `initial_run` (e.g. a full pass of `main`) runs once the watch is in place,
+# so files arriving while it works are not missed
+def watch_folder(path, debounce=1.0, poll=False, max_delay=30.0, verify=False, rules_file=None,
+                 initial_run=None):
+    root = os.path.normpath(path)
+    options = {'verify': verify, 'rules_file': rules_file}
+
+    watcher = None
+    initial = []
+    if not poll:
+        try:
+            watcher = InotifyWatcher(root)
+            initial = watcher.add_tree(root)
+        except OSError as e:
+            logger.warning(f'inotify unavailable ({e}), falling back to polling')
+
+    try:
+        if initial_run is not None:
+            initial_run()
+        # Loaded after the initial run, which records the files it processed
+        manifest = Manifest.load(root)
+        print(f"Obserwuję folder {root}. Naciśnij Ctrl+C, aby zakończyć.")
+        if watcher is not None:
+            watch_with_inotify(root, watcher, manifest, debounce, max_delay, options,
+                               filter_pending(root, initial, manifest))
+        else:
+            watch_with_polling(root, manifest, max(debounce, 1.0), options)
+    except KeyboardInterrupt:
+        print("Zakończono obserwowanie folderu.")
+    finally:
+        if watcher is not None:
+            watcher.close()
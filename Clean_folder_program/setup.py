@@ -8,6 +8,6 @@ setup(
     author='Adrian Karwat',
     author_email='adr.karwat@gmail.com',
     license='MIT',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     entry_points={'console_scripts': ['clean-folder = clean_folder.clean:clean_and_organize_folder']}
 )
\ No newline at end of file
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Multiprocessing.multiprocessing import cpu_count, factorize
+
+
+# Factorization for asyncio services: jobs run in a ProcessPoolExecutor so the
+# event loop never blocks on them. submit() waits while max_pending jobs are
+# already in the pool (backpressure), every job can be cancelled or given a
+# timeout, and metrics() reports the queue depth. A job that is already running
+# in a worker cannot be interrupted: on timeout or cancellation the caller gets
+# control back at once, while its slot is only freed when the worker finishes.
+# Outcomes are counted as the caller sees them, so every submitted job ends up
+# in exactly one of completed, failed, cancelled and timed_out.
+class AsyncFactorizer:
+    def __init__(self, max_workers=None, max_pending=None, timeout=None):
+        self.max_workers = max_workers or cpu_count()
+        self.max_pending = max_pending or 4 * self.max_workers
+        self.timeout = timeout
+        self.executor = None
+        self.slots = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+
+    async def __aenter__(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self.slots = asyncio.Semaphore(self.max_pending)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Jobs that have not started are dropped, running ones finish in the background
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # Runs in the executor's thread. A job that outlived its timeout may finish after
+    # asyncio.run() has closed the loop, and then there is nothing left to update.
+    def notify(self, loop, future):
+        if loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self.job_done, future)
+        except RuntimeError:
+            # Closed between the check and the call
+            pass
+
+    # The pool's future is done: the worker is free again
+    def job_done(self, future):
+        self.in_flight -= 1
+        self.slots.release()
+
+    # The caller's task is done: a job cancelled or timed out while running
+    # in a worker is counted as such, not by how the worker finished
+    def result_done(self, task):
+        if task.cancelled():
+            self.cancelled += 1
+        elif isinstance(task.exception(), asyncio.TimeoutError):
+            self.timed_out += 1
+        elif task.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    async def wait_for_result(self, job, number, timeout):
+        try:
+            return await asyncio.wait_for(job, timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"Factorization of {number} timed out after {timeout} s") from None
+
+    # Waits for a free slot, then returns a task resolving to the divisors of number
+    async def submit(self, number, timeout=None):
+        loop = asyncio.get_running_loop()
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.submitted += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # The slot follows the pool's own future, which stays running after a timeout
+        future = self.executor.submit(factorize, number)
+        future.add_done_callback(lambda done: self.notify(loop, done))
+        job = asyncio.wrap_future(future)
+        timeout = timeout if timeout is not None else self.timeout
+        task = asyncio.create_task(self.wait_for_result(job, number, timeout))
+        task.add_done_callback(self.result_done)
+        return task
+
+    async def factorize(self, number, timeout=None):
+        return await (await self.submit(number, timeout))
+
+    # Results in input order; submitting is paced by the free slots
+    async def map(self, numbers, timeout=None):
+        jobs = []
+        try:
+            for number in numbers:
+                jobs.append(await self.submit(number, timeout))
+            return await asyncio.gather(*jobs)
+        except BaseException:
+            for job in jobs:
+                job.cancel()
+            raise
+
+    def metrics(self):
+        return {'waiting': self.waiting, 'in_flight': self.in_flight,
+                'queue_depth': self.waiting + self.in_flight, 'max_in_flight': self.max_in_flight,
+                'max_pending': self.max_pending, 'submitted': self.submitted,
+                'completed': self.completed, 'failed': self.failed,
+                'cancelled': self.cancelled, 'timed_out': self.timed_out}
+
+
+async def main():
+    async with AsyncFactorizer(max_pending=8) as factorizer:
+        a, b, c, d = await factorizer.map([128, 255, 99999, 10651060])
+        assert a == [1, 2, 4, 8, 16, 32, 64, 128]
+        assert d == [1, 2, 4, 5, 7, 10, 14, 20, 28, 35, 70, 140, 76079, 152158, 304316, 380395, 532553, 760790, 1065106, 1521580, 2130212, 2662765, 5325530, 10651060]
+
+        # The event loop keeps running while a batch is being factorized
+        start_time = time.time()
+        ticks = 0
+        batch = asyncio.create_task(factorizer.map(range(1, 20_001)))
+        while not batch.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        print(f"Batch of {len(batch.result())} numbers in {time.time() - start_time} s, "
+              f"{ticks} event loop ticks meanwhile")
+        print(f"Metrics: {factorizer.metrics()}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
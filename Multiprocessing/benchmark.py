@@ -0,0 +1,225 @@
+"""Benchmark harness for the factorization execution modes.
+
+Runs every mode (synchronous, parallel, persistent pool, NumPy batch, cached)
+on several input distributions, with warm-up runs, repeats timed with
+perf_counter_ns and scaling curves across worker counts. Memory is measured
+in a separate run per case (tracemalloc peak in this process, peak RSS of the
+worker processes sampled from /proc on Linux) so it does not distort the
+timings. The results are written as JSON, to compare the modes for a given
+kind of batch.
+
+Usage (from the repository root):
+    python -m Multiprocessing.benchmark --size 20000 --workers 1 2 4 --output results.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from multiprocessing import resource_tracker
+
+from Multiprocessing.multiprocessing import (
+    FactorizationCache, FactorizationPool, factorize_batch, factorize_parallel,
+    factorize_synchronous, is_prime, np)
+
+
+PARALLEL_MODES = ('parallel', 'pool')
+MODES = ('synchronous', 'parallel', 'pool', 'batch', 'cached')
+DISTRIBUTIONS = ('uniform', 'skewed', 'primes', 'composite')
+
+
+def random_prime(rng, low, high):
+    while True:
+        candidate = rng.randrange(low, high) | 1
+        if is_prime(candidate):
+            return candidate
+
+
+# uniform: random integers below max_value; skewed: mostly small numbers and a few
+# large semiprimes; primes: random primes below max_value; composite: products of
+# small primes with many divisors
+def generate_inputs(distribution, size, max_value, seed):
+    rng = random.Random(seed)
+    if distribution == 'uniform':
+        return [rng.randrange(1, max_value) for _ in range(size)]
+    if distribution == 'skewed':
+        large = max(1, size // 100)
+        numbers = [rng.randrange(1, 10_000) for _ in range(size - large)]
+        numbers += [random_prime(rng, 1 << 30, 1 << 31) * random_prime(rng, 1 << 30, 1 << 31)
+                    for _ in range(large)]
+        rng.shuffle(numbers)
+        return numbers
+    if distribution == 'primes':
+        return [random_prime(rng, 2, max_value) for _ in range(size)]
+    small_primes = [2, 3, 5, 7, 11, 13, 17, 19, 23]
+    numbers = []
+    for _ in range(size):
+        number = 1
+        while number * 2 <= max_value:
+            factor = rng.choice(small_primes)
+            if number * factor > max_value:
+                break
+            number *= factor
+        numbers.append(number)
+    return numbers
+
+
+# Returns a callable running one batch in the given mode, plus a cleanup callable;
+# pool start-up and cache warm-up happen here, outside the measured runs
+def prepare(mode, numbers, workers):
+    if mode == 'synchronous':
+        return lambda: factorize_synchronous(*numbers), lambda: None
+    if mode == 'parallel':
+        return lambda: factorize_parallel(*numbers, processes=workers), lambda: None
+    if mode == 'pool':
+        pool = FactorizationPool(processes=workers)
+        return lambda: pool.map(numbers), pool.close
+    if mode == 'batch':
+        return lambda: factorize_batch(numbers), lambda: None
+    cache = FactorizationCache(maxsize=len(numbers))
+    factorize_synchronous(*numbers, cache=cache)
+    return lambda: factorize_synchronous(*numbers, cache=cache), lambda: None
+
+
+# Samples the peak RSS (VmHWM) of the live worker processes while one case runs.
+# RUSAGE_CHILDREN only keeps a high-water mark over the whole benchmark, so
+# every case after the largest one would report that case's memory. Workers
+# of a persistent pool count too, as they are alive during the case.
+class WorkerMemorySampler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        # /proc is Linux only
+        self.peak = 0 if os.path.isdir('/proc/self/task') else None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    # The shared memory resource tracker is a child process too, but not a worker
+    @staticmethod
+    def child_pids():
+        pids = set()
+        for tid in os.listdir('/proc/self/task'):
+            try:
+                with open(f'/proc/self/task/{tid}/children') as file:
+                    pids.update(file.read().split())
+            except OSError:
+                continue
+        pids.discard(str(getattr(resource_tracker._resource_tracker, '_pid', None)))
+        return pids
+
+    @staticmethod
+    def peak_rss(pid):
+        try:
+            with open(f'/proc/{pid}/status') as file:
+                for line in file:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def sample(self):
+        for pid in self.child_pids():
+            self.peak = max(self.peak, self.peak_rss(pid))
+
+    def run(self):
+        while self.peak is not None and not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        # Last look at workers that outlive the run, like a persistent pool's
+        if self.peak is not None:
+            self.sample()
+
+
+def measure(mode, numbers, workers, warmup, repeat):
+    run, cleanup = prepare(mode, numbers, workers)
+    try:
+        for _ in range(warmup):
+            run()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            run()
+            timings.append(time.perf_counter_ns() - start)
+
+        tracemalloc.start()
+        with WorkerMemorySampler() as sampler:
+            run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        cleanup()
+
+    median = statistics.median(timings)
+    return {
+        'min_ns': min(timings), 'median_ns': int(median), 'mean_ns': int(statistics.mean(timings)),
+        'stdev_ns': int(statistics.stdev(timings)) if len(timings) > 1 else 0,
+        'numbers_per_second': round(len(numbers) / (median / 1e9), 1),
+        # Worker RSS is None for modes without worker processes
+        'peak_python_bytes': peak, 'workers_peak_rss_bytes': sampler.peak or None,
+    }
+
+
+def print_case(case):
+    workers = case['workers'] if case['workers'] is not None else '-'
+    print(f"  {case['distribution']:<10} {case['mode']:<12} {workers:>7} "
+          f"{case['median_ns'] / 1e6:>12.2f} {case['numbers_per_second']:>14.0f} "
+          f"{case['peak_python_bytes'] / 2**20:>10.1f}")
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=10_000, help='Numbers per batch.')
+    parser.add_argument('--max-value', type=int, default=10**8)
+    parser.add_argument('--distributions', nargs='+', choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help='Worker counts for the scaling curve (default: powers of two up to cpu_count).')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file for the results.')
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers or [2 ** i for i in range(int(math.log2(cpus)) + 1)]
+    modes = [mode for mode in args.modes if mode != 'batch' or np is not None]
+
+    print(f"  {'inputs':<10} {'mode':<12} {'workers':>7} {'median ms':>12} {'numbers/s':>14} {'peak MiB':>10}")
+    cases = []
+    for distribution in args.distributions:
+        numbers = generate_inputs(distribution, args.size, args.max_value, args.seed)
+        for mode in modes:
+            if mode == 'batch' and max(numbers) >= 2 ** 63:
+                continue
+            for worker_count in workers if mode in PARALLEL_MODES else [None]:
+                case = dict(distribution=distribution, mode=mode, workers=worker_count,
+                            **measure(mode, numbers, worker_count, args.warmup, args.repeat))
+                print_case(case)
+                cases.append(case)
+
+    results = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+        'cpu_count': cpus, 'params': {key: value for key, value in vars(args).items() if key != 'output'},
+        'cases': cases,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main_benchmark()
@@ -1,29 +1,580 @@
+import bisect
+import dbm
+import itertools
+import json
+import math
+import queue
+import random
 import time
-from multiprocessing import Pool, cpu_count
+from array import array
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 
-def factorize(number):
-    factors = []
-    for i in range(1, number + 1):
-        if number % i == 0:
-            factors.append(i)
+try:
+    import numpy as np
+except ImportError:
+    # Only the batch mode needs NumPy
+    np = None
+
+INT64_MAX = (1 << 63) - 1
+# Smaller results are cheaper to pickle than to pass through a new shared memory segment
+SHARED_MEMORY_MIN_ITEMS = 4096
+
+# Largest number the batch mode factorizes through its smallest-prime-factor
+# table (4 bytes per entry); larger inputs fall back to prime_factors
+SPF_TABLE_LIMIT = 1 << 26
+# A table entry costs about 20 ns to sieve and prime_factors about 20 us per number
+# below 10**8, so the table only grows to this many entries per number in the batch
+SPF_ENTRIES_PER_NUMBER = 1024
+
+SIEVE_LIMIT = 1 << 20
+SEGMENT_SIZE = 1 << 16
+# Deterministic Miller-Rabin bases for every n < 3.3 * 10**24
+MILLER_RABIN_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+def simple_sieve(limit):
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0:2] = b'\x00\x00'
+    for i in range(2, math.isqrt(limit) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit + 1, i)))
+    return [i for i in range(limit + 1) if sieve[i]]
+
+# Primes up to limit, sieved one segment at a time so memory stays O(sqrt(limit) + segment)
+def segmented_sieve(limit, segment_size=SEGMENT_SIZE):
+    base_primes = simple_sieve(math.isqrt(limit))
+    primes = list(base_primes)
+    low = math.isqrt(limit) + 1
+    while low <= limit:
+        high = min(low + segment_size - 1, limit)
+        segment = bytearray([1]) * (high - low + 1)
+        for p in base_primes:
+            start = max(p * p, (low + p - 1) // p * p)
+            if start > high:
+                continue
+            segment[start - low::p] = bytes(len(range(start, high + 1, p)))
+        primes.extend(low + i for i, is_prime in enumerate(segment) if is_prime)
+        low = high + 1
+    return primes
+
+SMALL_PRIMES = segmented_sieve(SIEVE_LIMIT)
+
+def is_prime(number):
+    if number < 2:
+        return False
+    for p in MILLER_RABIN_BASES:
+        if number % p == 0:
+            return number == p
+    d, s = number - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in MILLER_RABIN_BASES:
+        x = pow(a, d, number)
+        if x in (1, number - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % number
+            if x == number - 1:
+                break
+        else:
+            return False
+    return True
+
+# Pollard's rho with Brent's cycle detection, returns a non-trivial factor of a composite number
+def pollard_rho(number):
+    if number % 2 == 0:
+        return 2
+    while True:
+        y, c, m = random.randrange(1, number), random.randrange(1, number), 128
+        g, r, q = 1, 1, 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % number
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % number
+                    q = q * abs(x - y) % number
+                g = math.gcd(q, number)
+                k += m
+            r *= 2
+        if g == number:
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % number
+                g = math.gcd(abs(x - ys), number)
+        if g != number:
+            return g
+
+# Index into SMALL_PRIMES past the last prime trial division of number has to try;
+# numbers below 2 (zero and negatives included) need none
+def trial_division_bound(number):
+    if number < 2:
+        return 0
+    return bisect.bisect_right(SMALL_PRIMES, math.isqrt(number))
+
+# Divides out the sieved primes SMALL_PRIMES[start:stop], returns ({prime: exponent}, cofactor)
+def trial_divide(number, start=0, stop=None):
+    factors = {}
+    for p in itertools.islice(SMALL_PRIMES, start, stop):
+        if p * p > number:
+            break
+        while number % p == 0:
+            factors[p] = factors.get(p, 0) + 1
+            number //= p
+    return factors, number
+
+# Adds the factorization of a cofactor without prime factors below the sieve limit
+def split_cofactor(number, factors):
+    if number == 1:
+        return factors
+    if number <= SIEVE_LIMIT * SIEVE_LIMIT or is_prime(number):
+        factors[number] = factors.get(number, 0) + 1
+        return factors
+
+    stack = [number]
+    while stack:
+        n = stack.pop()
+        if is_prime(n):
+            factors[n] = factors.get(n, 0) + 1
+        else:
+            d = pollard_rho(n)
+            stack.extend((d, n // d))
     return factors
 
-def factorize_synchronous(*numbers):
+# Prime factorization as {prime: exponent}: trial division by the sieved primes,
+# then Pollard's rho for whatever cofactor is left
+def prime_factors(number):
+    factors, cofactor = trial_divide(number)
+    return split_cofactor(cofactor, factors)
+
+def divisors_from_factors(factors):
+    divisors = [1]
+    for p, exponent in factors.items():
+        divisors = [d * p ** e for d in divisors for e in range(exponent + 1)]
+    return sorted(divisors)
+
+# Bounded LRU cache of prime factorizations. A miss is factorized by trial
+# division that stops as soon as the remaining cofactor is cached, so n * m
+# reuses the factorization of m; product() merges cached factorizations directly.
+# With a path, the entries are kept in a dbm key-value file between runs.
+class FactorizationCache:
+    def __init__(self, maxsize=100_000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.composed = 0
+        self.evictions = 0
+        if path is not None:
+            self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, number):
+        factors = self.entries.get(number)
+        if factors is not None:
+            self.entries.move_to_end(number)
+        return factors
+
+    def store(self, number, factors):
+        self.entries[number] = tuple(sorted(factors.items()))
+        self.entries.move_to_end(number)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def factors(self, number):
+        cached = self.lookup(number)
+        if cached is not None:
+            self.hits += 1
+            return dict(cached)
+        self.misses += 1
+
+        factors, remaining, known = {}, number, None
+        for p in SMALL_PRIMES:
+            if p * p > remaining:
+                break
+            while remaining % p == 0:
+                factors[p] = factors.get(p, 0) + 1
+                remaining //= p
+                known = self.lookup(remaining)
+                if known is not None:
+                    break
+            if known is not None:
+                self.composed += 1
+                for q, exponent in known:
+                    factors[q] = factors.get(q, 0) + exponent
+                remaining = 1
+                break
+        split_cofactor(remaining, factors)
+        self.store(number, factors)
+        return factors
+
+    def product(self, *numbers):
+        factors = {}
+        for number in numbers:
+            for p, exponent in self.factors(number).items():
+                factors[p] = factors.get(p, 0) + exponent
+        self.store(math.prod(numbers), factors)
+        return factors
+
+    def divisors(self, number):
+        return divisors_from_factors(self.factors(number))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses, 'composed': self.composed, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def load(self):
+        try:
+            with dbm.open(self.path, 'r') as db:
+                for key in db.keys():
+                    if len(self.entries) >= self.maxsize:
+                        break
+                    self.entries[int(key)] = tuple(tuple(pair) for pair in json.loads(db[key]))
+        except dbm.error[0]:
+            # No file yet, the cache starts empty
+            pass
+
+    # Rewrites the file with the current entries, so evicted ones do not pile up
+    def save(self):
+        with dbm.open(self.path, 'n') as db:
+            for number, factors in self.entries.items():
+                db[str(number)] = json.dumps(factors)
+
+    def close(self):
+        if self.path is not None:
+            self.save()
+
+def factorize(number, cache=None):
+    if number < 1:
+        return []
+    if cache is not None:
+        return cache.divisors(number)
+    return divisors_from_factors(prime_factors(number))
+
+def factorize_synchronous(*numbers, cache=None):
     result = []
     start_time = time.time()
     for number in numbers:
-        result.append(factorize(number))
+        result.append(factorize(number, cache))
     sync_time = time.time() - start_time
     return sync_time, result
 
-def factorize_parallel(*numbers):
-    result = []
+# Rough cost of factorizing number, in trial divisions: the sieved primes up to
+# sqrt(number), plus about number ** (1/4) rho steps when a large cofactor may remain
+def estimate_cost(number):
+    if number < 2:
+        return 1
+    cost = trial_division_bound(number)
+    if number > SIEVE_LIMIT * SIEVE_LIMIT:
+        cost += min(math.isqrt(math.isqrt(number)), 1 << 40)
+    return cost
+
+# Splitting the work into tasks of about equal cost: inputs whose trial division
+# alone exceeds the target task cost are split into ranges of sieved primes,
+# smaller ones are batched together into chunks
+def schedule(numbers, workers, min_chunk_cost=20_000):
+    costs = [estimate_cost(number) for number in numbers]
+    target = max(sum(costs) // (workers * 4), min_chunk_cost)
+    tasks, chunk, chunk_cost = [], [], 0
+    for index, (number, cost) in enumerate(zip(numbers, costs)):
+        bound = trial_division_bound(number)
+        if bound > target:
+            parts = min(workers, -(-bound // target))
+            step = -(-bound // parts)
+            tasks.extend(('range', index, number, start, min(start + step, bound))
+                         for start in range(0, bound, step))
+            continue
+        chunk.append((index, number))
+        chunk_cost += cost
+        if chunk_cost >= target:
+            tasks.append(('chunk', chunk))
+            chunk, chunk_cost = [], 0
+    if chunk:
+        tasks.append(('chunk', chunk))
+    return tasks
+
+def run_task(task):
+    if task[0] == 'chunk':
+        return task[0], [(index, factorize(number)) for index, number in task[1]]
+    _, index, number, start, stop = task
+    return task[0], (index, trial_divide(number, start, stop)[0])
+
+def finish_cofactor(task):
+    index, cofactor, factors = task
+    return index, divisors_from_factors(split_cofactor(cofactor, factors))
+
+def factorize_parallel(*numbers, processes=None):
+    result = [None] * len(numbers)
+    partial = {}
     start_time = time.time()
-    with Pool(processes=cpu_count()) as pool:
-        result = pool.map(factorize, numbers)
+    processes = processes or cpu_count()
+    with Pool(processes=processes) as pool:
+        for kind, payload in pool.imap_unordered(run_task, schedule(numbers, processes)):
+            if kind == 'chunk':
+                for index, divisors in payload:
+                    result[index] = divisors
+            else:
+                index, factors = payload
+                merged = partial.setdefault(index, {})
+                for p, exponent in factors.items():
+                    merged[p] = merged.get(p, 0) + exponent
+
+        # Whatever the prime ranges did not divide out is a cofactor above the
+        # sieve limit, which may still need Pollard's rho
+        cofactors = [(index, numbers[index] // math.prod(p ** e for p, e in factors.items()), factors)
+                     for index, factors in partial.items()]
+        for index, divisors in pool.imap_unordered(finish_cofactor, cofactors):
+            result[index] = divisors
     parallel_time = time.time() - start_time
     return parallel_time, result
 
+# Smallest prime factor of every integer up to limit, sieved with NumPy slices
+def smallest_prime_factors(limit):
+    spf = np.zeros(limit + 1, dtype=np.int32)
+    for p in SMALL_PRIMES if limit >= SIEVE_LIMIT else simple_sieve(math.isqrt(limit)):
+        if p * p > limit:
+            break
+        multiples = spf[p * p::p]
+        multiples[multiples == 0] = p
+    unset = np.flatnonzero(spf == 0)
+    spf[unset] = unset
+    return spf
+
+# Prime factorizations of a batch as parallel arrays (owner index, prime, exponent),
+# grouped by owner. All numbers up to the table limit are divided by their smallest
+# prime factor together, one round per prime factor of the largest input. The limit
+# follows the batch size, so a small batch of large numbers does not build a huge table.
+def batch_prime_factors(numbers):
+    table_limit = min(SPF_TABLE_LIMIT, SPF_ENTRIES_PER_NUMBER * len(numbers))
+    small = np.flatnonzero((numbers > 1) & (numbers <= table_limit))
+    owners, primes = [], []
+    if len(small):
+        spf = smallest_prime_factors(int(numbers[small].max()))
+        remaining = numbers[small].copy()
+        while len(small):
+            p = spf[remaining]
+            owners.append(small)
+            primes.append(p.astype(np.int64))
+            remaining //= p
+            left = remaining > 1
+            small, remaining = small[left], remaining[left]
+    owners = np.concatenate(owners) if owners else np.zeros(0, dtype=np.int64)
+    primes = np.concatenate(primes) if primes else np.zeros(0, dtype=np.int64)
+
+    # Run-length encoding of the (owner, prime) pairs gives the exponents
+    order = np.lexsort((primes, owners))
+    owners, primes = owners[order], primes[order]
+    starts = np.flatnonzero(np.r_[len(owners) > 0, (owners[1:] != owners[:-1]) | (primes[1:] != primes[:-1])])
+    exponents = np.diff(np.r_[starts, len(owners)])
+    owners, primes = owners[starts], primes[starts]
+
+    large = np.flatnonzero(numbers > table_limit)
+    if len(large):
+        factored = [(index, p, e) for index in large.tolist()
+                    for p, e in prime_factors(int(numbers[index])).items()]
+        extra_owners, extra_primes, extra_exponents = np.array(factored, dtype=np.int64).T
+        order = np.argsort(np.r_[owners, extra_owners], kind='stable')
+        owners = np.r_[owners, extra_owners][order]
+        primes = np.r_[primes, extra_primes][order]
+        exponents = np.r_[exponents, extra_exponents][order]
+    return owners, primes, exponents
+
+def divisor_counts(numbers):
+    numbers = as_int64_batch(numbers)
+    counts = (numbers >= 1).astype(np.int64)
+    owners, _, exponents = batch_prime_factors(numbers)
+    np.multiply.at(counts, owners, exponents + 1)
+    return counts
+
+def as_int64_batch(numbers):
+    if np is None:
+        raise ImportError('The batch mode needs NumPy')
+    if not isinstance(numbers, np.ndarray) and any(number > INT64_MAX for number in numbers):
+        raise ValueError('The batch mode handles numbers up to 2**63 - 1')
+    return np.asarray(numbers, dtype=np.int64)
+
+# Divisors of a whole batch in CSR form: the sorted divisors of numbers[i] are
+# values[offsets[i]:offsets[i + 1]]. Every number starts with the divisor 1 and
+# in round k all current divisors are multiplied by the powers of its k-th prime.
+def factorize_batch(numbers):
+    numbers = as_int64_batch(numbers)
+    owners, primes, exponents = batch_prime_factors(numbers)
+    group_starts = np.r_[0, np.flatnonzero(owners[1:] != owners[:-1]) + 1]
+    sizes = np.diff(np.r_[group_starts, len(owners)])
+    ranks = np.arange(len(owners)) - np.repeat(group_starts, sizes)
+
+    owner = np.flatnonzero(numbers >= 1)
+    values = np.ones(len(owner), dtype=np.int64)
+    for rank in range(int(ranks.max()) + 1 if len(ranks) else 0):
+        in_round = ranks == rank
+        round_owners, round_primes = owners[in_round], primes[in_round]
+        round_repeats = exponents[in_round] + 1
+
+        # Table of p ** 0 .. p ** e for every prime of the round, after a leading
+        # 1 that numbers without a prime in this round multiply by
+        power_starts = np.cumsum(round_repeats) - round_repeats
+        exponent_of = np.arange(round_repeats.sum()) - np.repeat(power_starts, round_repeats)
+        power_table = np.r_[1, np.repeat(round_primes, round_repeats) ** exponent_of]
+        repeats = np.ones(len(numbers), dtype=np.int64)
+        table_starts = np.zeros(len(numbers), dtype=np.int64)
+        repeats[round_owners] = round_repeats
+        table_starts[round_owners] = power_starts + 1
+
+        per_value = repeats[owner]
+        value_starts = np.cumsum(per_value) - per_value
+        values = np.repeat(values, per_value)
+        owner = np.repeat(owner, per_value)
+        values *= power_table[table_starts[owner] + np.arange(len(values))
+                              - np.repeat(value_starts, per_value)]
+
+    # One sort on (owner, divisor) packed into a single key when it fits in int64
+    offsets = np.r_[0, np.cumsum(np.bincount(owner, minlength=len(numbers)))]
+    largest = int(numbers.max()) + 1 if len(numbers) else 1
+    if len(numbers) * largest <= INT64_MAX:
+        keys = np.sort(owner * largest + values)
+        return offsets, keys - owner * largest
+    return offsets, values[np.lexsort((values, owner))]
+
+def csr_to_lists(offsets, values):
+    return [values[start:stop].tolist() for start, stop in zip(offsets[:-1], offsets[1:])]
+
+# Runs in a worker: factorizes a chunk and packs all divisors into one int64
+# buffer; large buffers go through shared memory, small ones are pickled
+def factorize_packed(numbers):
+    results = [factorize(number) for number in numbers]
+    lengths = [len(divisors) for divisors in results]
+    total = sum(lengths)
+    if any(number > INT64_MAX for number in numbers):
+        return 'lists', results, lengths
+    values = array('q', itertools.chain.from_iterable(results))
+    if total < SHARED_MEMORY_MIN_ITEMS:
+        return 'array', values, lengths
+    shm = SharedMemory(create=True, size=total * values.itemsize)
+    shm.buf[:total * values.itemsize] = memoryview(values).cast('B')
+    shm.close()
+    return 'shared', shm.name, lengths
+
+# Runs in the parent: copies the divisors out of the transport and frees it
+def unpack_packed(packed):
+    kind, payload, lengths = packed
+    if kind == 'lists':
+        return payload
+    if kind == 'shared':
+        shm = SharedMemory(name=payload)
+        try:
+            values = array('q')
+            values.frombytes(shm.buf[:sum(lengths) * values.itemsize])
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        values = payload
+    results, offset = [], 0
+    for length in lengths:
+        results.append(values[offset:offset + length])
+        offset += length
+    return results
+
+class PendingFactorization:
+    def __init__(self, async_result):
+        self.async_result = async_result
+
+    def ready(self):
+        return self.async_result.ready()
+
+    def get(self, timeout=None):
+        return unpack_packed(self.async_result.get(timeout))[0]
+
+# Long-lived worker pool for services that factorize continuously: the processes
+# are started once, and divisors come back as packed int64 arrays (array('q'),
+# or plain lists for inputs above the int64 range) instead of pickled lists.
+# At most max_pending chunks are in flight or waiting to be yielded at a time.
+class FactorizationPool:
+    def __init__(self, processes=None, chunksize=256, max_pending=None):
+        self.processes = processes or cpu_count()
+        self.chunksize = chunksize
+        self.max_pending = max_pending or 4 * self.processes
+        # Workers must share the parent's resource tracker, otherwise each one would
+        # try to clean up the segments it created (and the parent already unlinked)
+        resource_tracker.ensure_running()
+        self.pool = Pool(processes=self.processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, number):
+        return PendingFactorization(self.pool.apply_async(factorize_packed, ([number],)))
+
+    def chunks(self, numbers):
+        numbers = iter(numbers)
+        while chunk := list(itertools.islice(numbers, self.chunksize)):
+            yield chunk
+
+    # Yields divisors in input order, or (index, divisors) as soon as each chunk is done.
+    # Chunks are submitted from the caller's side, only while fewer than max_pending are
+    # in flight or waiting to be yielded, so the input is read lazily and the pool's own
+    # threads never block; in order mode, finished chunks wait in a reorder buffer until
+    # all earlier ones are out.
+    def stream(self, numbers, ordered=True):
+        chunks = zip(itertools.count(0, self.chunksize), self.chunks(numbers))
+        done = queue.SimpleQueue()
+        pending, finished, next_start = {}, {}, 0
+        try:
+            while True:
+                while len(pending) + len(finished) < self.max_pending:
+                    task = next(chunks, None)
+                    if task is None:
+                        break
+                    start, chunk = task
+                    pending[start] = self.pool.apply_async(
+                        factorize_packed, (chunk,),
+                        callback=lambda _, start=start: done.put(start),
+                        error_callback=lambda _, start=start: done.put(start))
+                if not pending:
+                    return
+
+                start = done.get()
+                results = unpack_packed(pending.pop(start).get())
+                if not ordered:
+                    yield from enumerate(results, start)
+                    continue
+                finished[start] = results
+                while next_start in finished:
+                    results = finished.pop(next_start)
+                    yield from results
+                    next_start += len(results)
+        finally:
+            # When the caller stops reading early, the chunks still in flight are
+            # collected so their shared memory gets unlinked
+            for async_result in pending.values():
+                async_result.wait()
+                if async_result.successful():
+                    unpack_packed(async_result.get())
+
+    def map(self, numbers):
+        return list(self.stream(numbers))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
 if __name__ == '__main__':
     #synchronous version
     (synchronous_time, [a, b, c, d]) = factorize_synchronous(128, 255, 99999, 10651060)
@@ -43,7 +594,31 @@ if __name__ == '__main__':
     assert h == [1, 2, 4, 5, 7, 10, 14, 20, 28, 35, 70, 140, 76079, 152158, 304316, 380395, 532553, 760790, 1065106, 1521580, 2130212, 2662765, 5325530, 10651060]
     print(f"Time: {parallel_time} s\n")
 
-    if parallel_time > synchronous_time:
-        print("The synchronous version is faster.\n")
-    else:
-        print("The parallel version is faster.\n")
+    #persistent pool version, the pool is started before the timer
+    with FactorizationPool() as factorization_pool:
+        start_time = time.time()
+        pool_results = factorization_pool.map([128, 255, 99999, 10651060])
+        pool_time = time.time() - start_time
+    assert [list(divisors) for divisors in pool_results] == [a, b, c, d]
+    print(f"Persistent pool version time: {pool_time} s\n")
+
+    #cached version, the second pass is served from the cache
+    factorization_cache = FactorizationCache()
+    factorize_synchronous(128, 255, 99999, 10651060, cache=factorization_cache)
+    (cached_time, cached_results) = factorize_synchronous(128, 255, 99999, 10651060, 2 * 10651060,
+                                                          cache=factorization_cache)
+    assert cached_results[:4] == [a, b, c, d] and cached_results[4] == factorize(2 * 10651060)
+    print(f"Cached version time: {cached_time} s, {factorization_cache.stats()}\n")
+
+    #NumPy batch version, cross-checked against the synchronous one on a larger batch
+    if np is not None:
+        batch = [random.randrange(1, 10**7) for _ in range(100_000)] + [128, 255, 99999, 10651060]
+        start_time = time.time()
+        offsets, values = factorize_batch(batch)
+        batch_time = time.time() - start_time
+        assert csr_to_lists(offsets, values) == factorize_synchronous(*batch)[1]
+        batch_parallel_time, _ = factorize_parallel(*batch)
+        print(f"Batch of {len(batch)} numbers: NumPy {batch_time} s, parallel {batch_parallel_time} s\n")
+
+    # Single timings above include pool start-up and are not repeated,
+    # compare the modes with: python -m Multiprocessing.benchmark
@@ -0,0 +1,90 @@
+"""Streaming factorization of integers read from a file or stdin.
+
+Numbers are read lazily, one per line, factorized in chunks by a persistent
+process pool and written out as soon as they are ready, either in input order
+(through a reorder buffer) or tagged with their index as they finish. At most
+--max-pending chunks are held in memory, whatever the length of the input.
+
+Usage (from the repository root):
+    python -m Multiprocessing.stream numbers.txt --output divisors.txt
+    seq 1 1000000 | python -m Multiprocessing.stream --unordered --format json
+"""
+import argparse
+import contextlib
+import json
+import sys
+
+from Multiprocessing.multiprocessing import FactorizationPool
+
+
+# Invalid lines are reported on stderr and skipped, so one bad line does not stop a long run
+def read_numbers(file):
+    for line_number, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield int(line)
+        except ValueError:
+            print(f"Line {line_number}: not an integer: {line[:50]!r}", file=sys.stderr)
+
+
+def format_result(number, divisors, index, output_format):
+    if output_format == 'json':
+        record = {'number': number, 'divisors': list(divisors)}
+        if index is not None:
+            record = dict(index=index, **record)
+        return json.dumps(record)
+    prefix = f"{index}\t" if index is not None else ''
+    return f"{prefix}{number}: {' '.join(map(str, divisors))}"
+
+
+# The numbers of the chunks in flight are kept by index until their results are written
+def stream_factorizations(numbers, output, processes=None, chunksize=1024, max_pending=None,
+                          ordered=True, output_format='text'):
+    pending = {}
+
+    def remembered(numbers):
+        for index, number in enumerate(numbers):
+            pending[index] = number
+            yield number
+
+    # The stream is closed before the pool, also when writing fails half-way
+    with FactorizationPool(processes=processes, chunksize=chunksize, max_pending=max_pending) as pool, \
+            contextlib.closing(pool.stream(remembered(numbers), ordered=ordered)) as stream:
+        results = enumerate(stream) if ordered else stream
+        for index, divisors in results:
+            number = pending.pop(index)
+            output.write(format_result(number, divisors, None if ordered else index, output_format) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', nargs='?', default='-', help='File with one integer per line, "-" for stdin.')
+    parser.add_argument('--output', default='-', help='Output file, "-" for stdout.')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--chunksize', type=int, default=1024)
+    parser.add_argument('--max-pending', type=int, help='Chunks in flight at once (default: 4 per process).')
+    parser.add_argument('--unordered', action='store_true',
+                        help='Write results as they finish, tagged with the input index.')
+    parser.add_argument('--format', choices=['text', 'json'], default='text')
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        stream_factorizations(read_numbers(source), output, processes=args.processes,
+                              chunksize=args.chunksize, max_pending=args.max_pending,
+                              ordered=not args.unordered, output_format=args.format)
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`)
+        sys.stderr.close()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
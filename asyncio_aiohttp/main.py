@@ -4,6 +4,89 @@ from datetime import date, timedelta
 import abc
 import json
 import argparse
+import collections
+import random
+import sqlite3
+import time
+
+
+# Longest range of dates NBP serves in one request
+MAX_RANGE_DAYS = 93
+
+
+# Consecutive dates merged into (first, last) ranges of at most max_days days
+def date_ranges(dates, max_days=MAX_RANGE_DAYS):
+    ranges = []
+    for day in sorted(set(dates)):
+        if ranges and day - ranges[-1][1] == timedelta(days=1) and (day - ranges[-1][0]).days < max_days:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(date_range) for date_range in ranges]
+
+
+# Local timestamp of the midnight that ends the given "YYYY-MM-DD" day
+def day_end(day):
+    return time.mktime((date.fromisoformat(day) + timedelta(days=1)).timetuple())
+
+
+# Rates already fetched, keyed by (table, currency, date). Days without a published
+# rate are stored too (rate NULL) so they are not asked for again. Published rates
+# never change, so an entry fetched after its day had ended is kept for good; any
+# other entry expires after today_ttl seconds, since the day's rate may not have
+# been published yet when it was fetched.
+class RatesCache:
+    def __init__(self, path='exchange_rates_cache.sqlite', today_ttl=3600):
+        self.today_ttl = today_ttl
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS rates (tab TEXT, currency TEXT, day TEXT, rate TEXT, "
+            "fetched_at REAL, PRIMARY KEY (tab, currency, day))")
+
+    # {day: rate or None} for the days of the range with a fresh entry
+    def get(self, table, currency, start_date, end_date):
+        rows = self.connection.execute(
+            "SELECT day, rate, fetched_at FROM rates WHERE tab = ? AND currency = ? AND day BETWEEN ? AND ?",
+            (table, currency.upper(), f"{start_date:%Y-%m-%d}", f"{end_date:%Y-%m-%d}"))
+        now = time.time()
+        return {day: json.loads(rate) if rate is not None else None
+                for day, rate, fetched_at in rows
+                if fetched_at >= day_end(day) or now - fetched_at < self.today_ttl}
+
+    # Records every day of the fetched range up to today, with or without a rate
+    def put(self, table, currency, start_date, end_date, rates):
+        now = time.time()
+        day, last = start_date, min(end_date, date.today())
+        rows = []
+        while day <= last:
+            key = f"{day:%Y-%m-%d}"
+            rate = json.dumps(rates[key]) if key in rates else None
+            rows.append((table, currency.upper(), key, rate, now))
+            day += timedelta(days=1)
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?, ?)", rows)
+
+    # Whole tables are marked with a row for currency "*", so a day counts as cached
+    # only when the complete table was fetched for it: {day: {currency: rate}}
+    def get_tables(self, table, start_date, end_date):
+        marked = self.get(table, '*', start_date, end_date)
+        tables = {day: {} for day in marked}
+        rows = self.connection.execute(
+            "SELECT day, currency, rate FROM rates WHERE tab = ? AND currency != '*' AND day BETWEEN ? AND ?",
+            (table, f"{start_date:%Y-%m-%d}", f"{end_date:%Y-%m-%d}"))
+        for day, currency, rate in rows:
+            if day in tables and rate is not None:
+                tables[day][currency] = json.loads(rate)
+        return tables
+
+    def put_tables(self, table, start_date, end_date, tables):
+        self.put(table, '*', start_date, end_date, {day: True for day in tables})
+        for currency in {currency for rates in tables.values() for currency in rates}:
+            rates = {day: rates[currency] for day, rates in tables.items() if currency in rates}
+            self.put(table, currency, date.fromisoformat(min(rates)), date.fromisoformat(max(rates)), rates)
+
+    def close(self):
+        self.connection.close()
 
 
 class APIInterface(abc.ABC):
@@ -11,28 +94,153 @@ class APIInterface(abc.ABC):
     async def fetch_exchange_rate(self, start_date):
         pass
 
+    @abc.abstractmethod
+    async def fetch_exchange_rates(self, currency, start_date, end_date):
+        pass
+
+    @abc.abstractmethod
+    async def fetch_tables(self, table, start_date, end_date):
+        pass
+
+
+# Table C has buy and sell rates, tables A and B only the average rate
+def rate_from_entry(entry):
+    if 'mid' in entry:
+        return {'mid': entry['mid']}
+    return {'sale': entry['ask'], 'purchase': entry['bid']}
+
 
 class NBPAPIImplementation(APIInterface):
     base_url = "http://api.nbp.pl/api/exchangerates/rates/c/"
+    tables_url = "http://api.nbp.pl/api/exchangerates/tables/"
     currencies = ["EUR", "USD"]
+    retry_statuses = {429, 500, 502, 503, 504}
+    table = "C"
+
+    # One session for the lifetime of the object (use it as `async with`), so
+    # requests reuse pooled keep-alive connections instead of a new one each time.
+    # At most max_concurrency requests run at once and at most max_rate start per
+    # second; throttled (429), failing (5xx) and timed out requests are retried up
+    # to `retries` times with exponential backoff. With a RatesCache only the dates
+    # missing from it are requested.
+    def __init__(self, base_url=None, limit=100, limit_per_host=20, keepalive_timeout=30,
+                 dns_cache_ttl=300, max_concurrency=10, retries=4, backoff=0.5, timeout=10,
+                 cache=None, tables_url=None, max_rate=20):
+        if base_url is not None:
+            self.base_url = base_url
+        if tables_url is not None:
+            self.tables_url = tables_url
+        self.cache = cache
+        self.connector_options = dict(limit=limit, limit_per_host=limit_per_host,
+                                      keepalive_timeout=keepalive_timeout, ttl_dns_cache=dns_cache_ttl)
+        self.max_concurrency = max_concurrency
+        self.max_rate = max_rate
+        self.next_request_at = 0.0
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(**self.connector_options),
+            headers={'Accept': 'application/json'}, timeout=self.timeout)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
 
     async def fetch_exchange_rate(self, currency, start_date):
-        async with aiohttp.ClientSession() as session:
-            response = await session.get(f"{self.base_url}{currency}/last/10/?format=json")
-            if response.ok == False:
-                raise ValueError(
-                    f"Failed to fetch data for {currency} - status code: {response.status}")
-
-            data = await response.json()
-            rates = {}
-            for entry in data['rates']:
-                if entry['effectiveDate'] == start_date.strftime("%Y-%m-%d"):
-                    rates[currency.upper()] = {
-                        'sale': entry['ask'],
-                        'purchase': entry['bid']
-                    }
-                    break
-            return rates
+        rates = await self.fetch_exchange_rates(currency, start_date, start_date)
+        day = start_date.strftime("%Y-%m-%d")
+        return {currency.upper(): rates[day]} if day in rates else {}
+
+    # Delay before retry number `attempt`: the server's Retry-After when it sends one,
+    # otherwise exponential backoff with jitter
+    def retry_delay(self, attempt, retry_after=None):
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt * (0.5 + random.random())
+
+    # Spaces out the starts of requests to at most max_rate per second
+    async def wait_for_rate_limit(self):
+        if not self.max_rate:
+            return
+        now = asyncio.get_running_loop().time()
+        start_at = max(now, self.next_request_at)
+        self.next_request_at = start_at + 1 / self.max_rate
+        await asyncio.sleep(start_at - now)
+
+    # Decoded JSON of url, or None when NBP has no data for it (404). The semaphore
+    # is held only while a request is in flight, not while waiting to retry.
+    async def get_json(self, url):
+        if self.session is None:
+            raise RuntimeError("Use NBPAPIImplementation as 'async with' to open its session")
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            await self.wait_for_rate_limit()
+            try:
+                async with self.semaphore, self.session.get(url) as response:
+                    if response.status == 404:
+                        return None
+                    if response.ok:
+                        return await response.json()
+                    if response.status not in self.retry_statuses or attempt == self.retries:
+                        raise ValueError(f"Failed to fetch {url} - status code: {response.status}")
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise ValueError(f"Failed to fetch {url} - {e!r}") from e
+            await asyncio.sleep(self.retry_delay(attempt, retry_after))
+
+    # All rates of one currency between two dates: {date: rate}, from the cache
+    # where possible and one request per window of at most MAX_RANGE_DAYS missing dates
+    async def fetch_exchange_rates(self, currency, start_date, end_date):
+        cached = self.cache.get(self.table, currency, start_date, end_date) if self.cache else {}
+        days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        missing = date_ranges(day for day in days if f"{day:%Y-%m-%d}" not in cached)
+        fetched = await asyncio.gather(*(self.request_exchange_rates(currency, start, end)
+                                         for start, end in missing))
+        rates = {day: rate for day, rate in cached.items() if rate is not None}
+        for (start, end), new_rates in zip(missing, fetched):
+            if self.cache:
+                self.cache.put(self.table, currency, start, end, new_rates)
+            rates.update(new_rates)
+        return dict(sorted(rates.items()))
+
+    async def request_exchange_rates(self, currency, start_date, end_date):
+        url = f"{self.base_url}{currency}/{start_date:%Y-%m-%d}/{end_date:%Y-%m-%d}/?format=json"
+        # NBP answers 404 when no rates were published in the range (weekends, holidays)
+        data = await self.get_json(url)
+        if data is None:
+            return {}
+        return {entry['effectiveDate']: rate_from_entry(entry) for entry in data['rates']}
+
+    # Every currency of table A, B or C between two dates: {date: {currency: rate}},
+    # one request per window of at most MAX_RANGE_DAYS dates missing from the cache
+    async def fetch_tables(self, table, start_date, end_date):
+        table = table.upper()
+        cached = self.cache.get_tables(table, start_date, end_date) if self.cache else {}
+        days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        missing = date_ranges(day for day in days if f"{day:%Y-%m-%d}" not in cached)
+        fetched = await asyncio.gather(*(self.request_tables(table, start, end) for start, end in missing))
+        tables = {day: rates for day, rates in cached.items() if rates}
+        for (start, end), new_tables in zip(missing, fetched):
+            if self.cache:
+                self.cache.put_tables(table, start, end, new_tables)
+            tables.update(new_tables)
+        return dict(sorted(tables.items()))
+
+    async def request_tables(self, table, start_date, end_date):
+        url = f"{self.tables_url}{table}/{start_date:%Y-%m-%d}/{end_date:%Y-%m-%d}/?format=json"
+        data = await self.get_json(url)
+        if data is None:
+            return {}
+        return {day_table['effectiveDate']: {entry['code']: rate_from_entry(entry) for entry in day_table['rates']}
+                for day_table in data}
 
 
 class NBPAPI:
@@ -45,9 +253,69 @@ class NBPAPI:
         results = await asyncio.gather(*tasks)
         return {start_date.strftime("%Y-%m-%d"): {currency: rate for currency_rate in results for currency, rate in currency_rate.items()}}
 
+    # One request per currency and range of consecutive dates, all running at once
+    # (the implementation bounds how many are in flight), spread over the dates locally
+    async def get_exchange_rates_for_dates(self, dates, currencies):
+        jobs = [(currency, start, end) for currency in currencies for start, end in date_ranges(dates)]
+        results = await asyncio.gather(*(self.api_service.fetch_exchange_rates(*job) for job in jobs))
+        rates_by_currency = {}
+        for (currency, _, _), rates in zip(jobs, results):
+            rates_by_currency.setdefault(currency.upper(), {}).update(rates)
+
+        exchange_rates = {}
+        for day in dates:
+            key = day.strftime("%Y-%m-%d")
+            exchange_rates[key] = {currency: rates[key]
+                                   for currency, rates in rates_by_currency.items() if key in rates}
+        return exchange_rates
+
+    # Bulk mode: one request per table and range of consecutive dates, serving any
+    # subset of currencies (all of them when currencies is None). A currency listed
+    # in several tables gets the fields of all of them (mid from A, sale and purchase from C).
+    async def get_table_rates_for_dates(self, dates, tables, currencies=None):
+        wanted = {currency.upper() for currency in currencies} if currencies is not None else None
+        jobs = [(table, start, end) for table in tables for start, end in date_ranges(dates)]
+        results = await asyncio.gather(*(self.api_service.fetch_tables(*job) for job in jobs))
+
+        exchange_rates = {day.strftime("%Y-%m-%d"): {} for day in dates}
+        for day_tables in results:
+            for day, rates in day_tables.items():
+                if day not in exchange_rates:
+                    continue
+                for currency, rate in rates.items():
+                    if wanted is None or currency in wanted:
+                        exchange_rates[day].setdefault(currency, {}).update(rate)
+        return exchange_rates
+
+    # Rates for long spans, yielded as (date, {currency: rate}) newest first, one
+    # window of MAX_RANGE_DAYS days at a time. Up to `prefetch` windows are fetched
+    # concurrently ahead of the one being yielded, so memory does not grow with the span.
+    async def iter_exchange_rates(self, dates, currencies, bulk=False, tables=('C',), prefetch=4):
+        async def fetch_window(window):
+            if bulk:
+                return await self.get_table_rates_for_dates(window, tables, currencies)
+            return await self.get_exchange_rates_for_dates(window, currencies)
+
+        windows = iter([day for day in dates if start <= day <= end]
+                       for start, end in reversed(date_ranges(dates)))
+        pending = collections.deque()
+        try:
+            for window in windows:
+                pending.append(asyncio.create_task(fetch_window(window)))
+                if len(pending) < prefetch:
+                    continue
+                for item in sorted((await pending.popleft()).items(), reverse=True):
+                    yield item
+            while pending:
+                for item in sorted((await pending.popleft()).items(), reverse=True):
+                    yield item
+        finally:
+            for task in pending:
+                task.cancel()
+
     def get_start_dates(self, days_ago):
         today = date.today()
-        return [today - timedelta(days=i) for i in range(min(days_ago, 10))]
+        return [today - timedelta(days=i) for i in range(days_ago)]
 
 
 async def save_to_json(data, filename):
@@ -55,36 +323,58 @@ async def save_to_json(data, filename):
         json.dump(data, file)
 
 
+# Writes one JSON object from an async stream of (key, value) pairs, one pair at a time
+async def save_stream_to_json(items, filename):
+    count = 0
+    with open(filename, 'w') as file:
+        file.write('{')
+        async for key, value in items:
+            file.write(f"{',' if count else ''}\n{json.dumps(key)}: {json.dumps(value)}")
+            count += 1
+        file.write('\n}\n')
+    return count
+
+
 async def main():
     parser = argparse.ArgumentParser(description='Fetch exchange rates.')
     parser.add_argument(
         'days_ago', type=int, help='Number of days ago from which to fetch exchange rates.')
     parser.add_argument('--currencies', nargs='+',
-                        default=["EUR", "USD"], help='Currencies to fetch exchange rates for.')
+                        default=["EUR", "USD"], help='Currencies to fetch exchange rates for, "all" for every currency (implies --bulk).')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Fetch whole tables, one request per table, instead of one request per currency.')
+    parser.add_argument('--tables', nargs='+', type=str.upper, choices=['A', 'B', 'C'], default=['C'],
+                        help='NBP tables used in bulk mode: A and B have average rates, C buy and sell rates.')
+    parser.add_argument('--cache-file', default='exchange_rates_cache.sqlite',
+                        help='SQLite file with rates fetched by earlier runs.')
+    parser.add_argument('--no-cache', action='store_true', help='Always fetch from the NBP API.')
     args = parser.parse_args()
 
-    if args.days_ago > 10:
-        print("You can request data for up to 10 days ago. Fetching data from 10 days ago.")
-        days_ago = 10
-    else:
-        days_ago = args.days_ago
+    all_currencies = [currency.lower() for currency in args.currencies] == ['all']
+    bulk = args.bulk or all_currencies
+    currencies = None if all_currencies else args.currencies
 
-    api_service = NBPAPIImplementation()
-    api = NBPAPI(api_service)
-    start_dates = api.get_start_dates(days_ago)
-    exchange_rates = {}
-    for start_date in start_dates:
-        rates = await api.get_exchange_rates(start_date, args.currencies)
-        exchange_rates.update(rates)
-    await save_exchange_rates(exchange_rates)
+    cache = None if args.no_cache else RatesCache(args.cache_file)
+    try:
+        async with NBPAPIImplementation(cache=cache) as api_service:
+            api = NBPAPI(api_service)
+            start_dates = api.get_start_dates(args.days_ago)
+            exchange_rates = api.iter_exchange_rates(start_dates, currencies, bulk=bulk, tables=args.tables)
+            await save_exchange_rates(exchange_rates)
+    finally:
+        if cache is not None:
+            cache.close()
 
-    print(json.dumps(exchange_rates, indent=4))
+    # Short spans are also shown, as before
+    if args.days_ago <= 10:
+        with open('exchange_rates.json', 'r') as file:
+            print(json.dumps(json.load(file), indent=4))
 
 
 async def save_exchange_rates(exchange_rates):
     filename = 'exchange_rates.json'
-    await save_to_json(exchange_rates, filename)
-    print("Data has been saved to the file exchange_rates.json")
+    days = await save_stream_to_json(exchange_rates, filename)
+    print(f"Data for {days} days has been saved to the file exchange_rates.json")
 
 
 if __name__ == "__main__":